@@ -1,6 +1,3 @@
 """Package for cross-chain MEV detection.
 
 """
-REQUEST_RETRY_SECONDS = 10
-"""Constant for deciding in how many seconds a
-failed request should be retried."""
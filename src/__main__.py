@@ -1,6 +1,7 @@
 """Cross-chain MEV extraction entry point.
 
 """
+import concurrent.futures
 import dataclasses
 import datetime
 import json
@@ -12,20 +13,37 @@ from src.analysis.cross_chain_arbitrage import CrossChainArbitrage
 from src.analysis.cross_chain_match import CrossChainMatch
 from src.analysis.cross_chain_mev import CrossChainMev
 from src.api_utilities.fetch import DataFetcher
+from src.api_utilities.polygon_bridge import get_polygon_bridge_interactor
+from src.application import initialize_application
+from src.blockchains import get_ethereum_service
+from src.blockchains import get_polygon_service
 from src.config import get_config
 from src.database import initialize_database
-from src.logging import initialize_logging
 
 _logger = logging.getLogger(__name__)
 """Logger for this module."""
 
+_cross_chain_mev: typing.Optional[CrossChainMev] = None
+"""Per-worker cross-chain MEV candidate finder."""
+_cross_chain_match: typing.Optional[CrossChainMatch] = None
+"""Per-worker cross-chain transaction matcher."""
+_cross_chain_arbitrage: typing.Optional[CrossChainArbitrage] = None
+"""Per-worker cross-chain arbitrage analyzer."""
 
-def initialize_application():
-    """Initialize the application requirements.
+
+class Counts(typing.NamedTuple):
+    """The counts of the analyzed cross-chain MEV transactions.
 
     """
-    initialize_database()
-    initialize_logging()
+    candidates: int
+    fulfilled: int
+    bridged_back: int
+
+    def __add__(self, other: object) -> 'Counts':
+        assert isinstance(other, Counts)
+        return Counts(self.candidates + other.candidates,
+                      self.fulfilled + other.fulfilled,
+                      self.bridged_back + other.bridged_back)
 
 
 def fetch_data(block_number_start: int, block_number_end: int):
@@ -33,110 +51,109 @@ def fetch_data(block_number_start: int, block_number_end: int):
 
     """
     data_fetcher = DataFetcher()
-    data_fetcher.fetch_block_data(block_number_start, block_number_end)
-    data_fetcher.fetch_mev_block_data(block_number_start, block_number_end)
-    data_fetcher.fetch_and_process_traces(block_number_start, block_number_end)
+    try:
+        data_fetcher.fetch_block_data(block_number_start, block_number_end)
+        data_fetcher.fetch_mev_block_data(block_number_start, block_number_end)
+        data_fetcher.fetch_and_process_traces(block_number_start,
+                                              block_number_end)
+    finally:
+        data_fetcher.close()
+
 
+def initialize_analysis_worker():
+    """Initialize the analysis objects of a worker process. They hold
+    their own connection handles, so they must not be shared between
+    processes.
 
-def analyze_data_batch(cross_chain_mev: CrossChainMev,
-                       cross_chain_match: CrossChainMatch,
-                       cross_chain_arbitrage: CrossChainArbitrage,
-                       block_number_start: int,
-                       block_number_end: int) -> typing.Tuple[int, int, int]:
+    """
+    # The workers are forked after fetch_data has populated the
+    # parent's factory caches and database pool, so the inherited
+    # instances — keep-alive RPC sockets and SQLite connections that
+    # must not be shared across processes — are discarded before the
+    # analysis objects are built.
+    get_ethereum_service.cache_clear()
+    get_polygon_service.cache_clear()
+    get_polygon_bridge_interactor.cache_clear()
+    initialize_database()
+    global _cross_chain_mev, _cross_chain_match, _cross_chain_arbitrage
+    _cross_chain_mev = CrossChainMev()
+    _cross_chain_match = CrossChainMatch()
+    _cross_chain_arbitrage = CrossChainArbitrage()
+
+
+def analyze_data_batch(
+        block_number_start: int,
+        block_number_end: int) -> typing.Tuple[Counts, bytes, bytes]:
     """Analyze the data batch.
 
+    Returns
+    -------
+    tuple
+        The counts of the candidate, fulfilled and bridged back
+        cross-chain MEV transactions together with the serialized
+        fulfilled and failed extractions.
 
     """
-    block_to_cross_chain_mev_transactions = \
-        cross_chain_mev.find_cross_chain_mev_candidates(
+    assert _cross_chain_mev is not None
+    assert _cross_chain_match is not None
+    assert _cross_chain_arbitrage is not None
+    block_to_cross_chain_mev_transactions, number_of_candidates = \
+        _cross_chain_mev.find_cross_chain_mev_candidates(
             block_number_start, block_number_end)
-    total_len = 0
-    for key in block_to_cross_chain_mev_transactions:
-        total_len += len(block_to_cross_chain_mev_transactions[key])
     cross_chain_mev_extractions, cross_chain_mev_failed = \
-        cross_chain_match.match_cross_chain_mev_transactions(
+        _cross_chain_match.match_cross_chain_mev_transactions(
             block_to_cross_chain_mev_transactions)
-    cross_chain_arbitrage.analayze_cross_chain_arbitrage(
+    _cross_chain_arbitrage.analayze_cross_chain_arbitrage(
         cross_chain_mev_extractions)
 
-    with open("extractions_result.json", "a") as json_file:
-        for extraction in cross_chain_mev_extractions:
-            json_file.write(
-                json.dumps(dataclasses.asdict(extraction), indent=4))
-            json_file.write(',\n')
+    # The record bodies go through the stdlib json: the swap amounts
+    # and profits are Wei-scale integers beyond 64 bits, which orjson
+    # refuses to serialize.
+    result_bytes = b''.join(
+        json.dumps(dataclasses.asdict(extraction)).encode() + b'\n'
+        for extraction in cross_chain_mev_extractions)
+    failed_bytes = b''.join(
+        json.dumps(dataclasses.asdict(failed_extraction)).encode() + b'\n'
+        for failed_extraction in cross_chain_mev_failed)
 
-    with open("extractions_failed.json", "a") as json_file:
-        for failed_extraction in cross_chain_mev_failed:
-            json_file.write(
-                json.dumps(dataclasses.asdict(failed_extraction), indent=4))
-            json_file.write(',\n')
-
-    return total_len, len(cross_chain_mev_extractions), len(
-        cross_chain_mev_failed)
+    return Counts(number_of_candidates, len(cross_chain_mev_extractions),
+                  len(cross_chain_mev_failed)), result_bytes, failed_bytes
 
 
 def analyze_data(block_number_start: int, block_number_end: int):
     """Analyze the data batch.
 
     """
-    cross_chain_mev = CrossChainMev()
-    cross_chain_match = CrossChainMatch()
-    cross_chain_arbitrage = CrossChainArbitrage()
     batch_size = 1000
-    number_of_cross_chain_mev_candidates = 0
-    number_of_fulfilled_cross_chain_mev = 0
-    number_of_bridged_back_cross_chain_mev = 0
-    with open("extractions_result.json", "w") as json_file:
-        json_file.write('[\n')
-    with open("extractions_failed.json", "w") as json_file:
-        json_file.write('[\n')
+    total_counts = Counts(0, 0, 0)
+    batches = []
     while block_number_start + batch_size < block_number_end:
-        (number_of_cross_chain_mev_candidates_,
-         number_of_fulfilled_cross_chain_mev_,
-         number_of_bridged_back_cross_chain_mev_) = analyze_data_batch(
-             cross_chain_mev, cross_chain_match, cross_chain_arbitrage,
-             block_number_start, block_number_start + batch_size)
-        number_of_cross_chain_mev_candidates += \
-            number_of_cross_chain_mev_candidates_
-        number_of_fulfilled_cross_chain_mev += \
-            number_of_fulfilled_cross_chain_mev_
-        number_of_bridged_back_cross_chain_mev += \
-            number_of_bridged_back_cross_chain_mev_
+        batches.append((block_number_start, block_number_start + batch_size))
         block_number_start += batch_size
-
-    (number_of_cross_chain_mev_candidates_,
-     number_of_fulfilled_cross_chain_mev_,
-     number_of_bridged_back_cross_chain_mev_) = analyze_data_batch(
-         cross_chain_mev, cross_chain_match, cross_chain_arbitrage,
-         block_number_start, block_number_end)
-    number_of_cross_chain_mev_candidates += \
-        number_of_cross_chain_mev_candidates_
-    number_of_fulfilled_cross_chain_mev += \
-        number_of_fulfilled_cross_chain_mev_
-    number_of_bridged_back_cross_chain_mev += \
-        number_of_bridged_back_cross_chain_mev_
+    batches.append((block_number_start, block_number_end))
+    with open("extractions_result.jsonl", "wb",
+              buffering=1 << 20) as result_file, \
+            open("extractions_failed.jsonl", "wb",
+                 buffering=1 << 20) as failed_file, \
+            concurrent.futures.ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                initializer=initialize_analysis_worker) as executor:
+        futures = [
+            executor.submit(analyze_data_batch, batch_start, batch_end)
+            for batch_start, batch_end in batches
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            counts, result_bytes, failed_bytes = future.result()
+            total_counts += counts
+            result_file.write(result_bytes)
+            failed_file.write(failed_bytes)
 
     print('number of potential cross-chain MEV txs: '
-          f'{number_of_cross_chain_mev_candidates}')
+          f'{total_counts.candidates}')
     print('number of fulfilled cross-chain MEV extractions: '
-          f'{number_of_fulfilled_cross_chain_mev}')
+          f'{total_counts.fulfilled}')
     print('number of bridged back cross-chain MEV extractions: '
-          f'{number_of_bridged_back_cross_chain_mev}')
-
-    with open("extractions_result.json", "rb+") as json_file:
-        if number_of_fulfilled_cross_chain_mev > 0:
-            json_file.seek(-2, os.SEEK_END)
-            json_file.truncate()
-    with open("extractions_failed.json", "rb+") as json_file:
-        if number_of_bridged_back_cross_chain_mev > 0:
-            json_file.seek(-2, os.SEEK_END)
-            json_file.truncate()
-
-    with open("extractions_result.json", "a") as json_file:
-        json_file.write(']')
-
-    with open("extractions_failed.json", "a") as json_file:
-        json_file.write(']')
+          f'{total_counts.bridged_back}')
 
 
 if __name__ == "__main__":
@@ -1,21 +1,22 @@
 """Module for analyzing cross-chain arbitrages.
 
 """
-import collections
 import logging
 
-from src.api_utilities.polygon_bridge import PolygonBridgeInteractor
-from src.blockchains.ethereum import EthereumService
-from src.blockchains.polygon import PolygonService
-from src.config import get_config
+from src.api_utilities.polygon_bridge import get_polygon_bridge_interactor
+from src.blockchains import get_ethereum_service
+from src.blockchains import get_polygon_service
 from src.domain import CrossChainMevExtraction
 from src.domain import PolygonBridgeInteraction
 
-_ETH_TO_POLYGON_TOKEN_MAP = collections.defaultdict(lambda: [])
-_ETH_TO_POLYGON_TOKEN_MAP['0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2'] = [
-    '0x7ceB23fD6bC0adD59E62ac25578270cFf1b9f619',
-    '0xAe740d42E4ff0C5086b2b5b5d149eB2F9e1A754F'
-]
+_ETH_TO_POLYGON_TOKEN_SET: dict[str, frozenset[str]] = {
+    '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2'.lower(): frozenset({
+        '0x7ceB23fD6bC0adD59E62ac25578270cFf1b9f619'.lower(),
+        '0xAe740d42E4ff0C5086b2b5b5d149eB2F9e1A754F'.lower()
+    })
+}
+"""Extra known Polygon tokens for an Ethereum token, keyed by the
+lowercased Ethereum token address."""
 
 _logger = logging.getLogger(__name__)
 """Logger for this module."""
@@ -29,16 +30,27 @@ class CrossChainArbitrage:
         """Initialize and construct the instance.
 
         """
-        self.__ethereum_service = EthereumService(
-            get_config()['URL']['ethereum'])
-        self.__polygon_service = PolygonService(get_config()['URL']['polygon'])
-        self.__polygon_bridge_interactor = PolygonBridgeInteractor()
+        self.__ethereum_service = get_ethereum_service()
+        self.__polygon_service = get_polygon_service()
+        self.__polygon_bridge_interactor = get_polygon_bridge_interactor()
+        self.__ethereum_gas_paid_cache: dict[str, int] = {}
+        self.__polygon_gas_paid_cache: dict[str, int] = {}
 
     def analayze_cross_chain_arbitrage(
-            self, cross_chain_mev_extractions: list[CrossChainMevExtraction]):
+            self, cross_chain_mev_extractions: list[CrossChainMevExtraction],
+            skip_non_cyclic_gas: bool = False):
         """Analyze cross chain arbitrages. Find cyclcic arbitrages
         and the profits.
 
+        Parameters
+        ----------
+        cross_chain_mev_extractions : list of CrossChainMevExtraction
+            The extractions to analyze.
+        skip_non_cyclic_gas : bool
+            If True, the gas-paid lookups are only performed for cyclic
+            arbitrages; the gas fields of the other extractions stay
+            unset, saving two to three RPCs per non-cyclic extraction.
+
         """
         for extraction in cross_chain_mev_extractions:
             direction = extraction.direction
@@ -47,35 +59,88 @@ class CrossChainArbitrage:
                     self.__analyze_from_ethereum_arbitrage(extraction)
                 elif direction is PolygonBridgeInteraction.TO_ETHEREUM:
                     self.__analyze_to_ethereum_arbitrage(extraction)
-                extraction.ethereum_leg.gas_paid = \
-                    self.__ethereum_service.get_transaction_gas_paid(
-                        extraction.ethereum_leg.transaction_hash)
-                extraction.polygon_leg.bridge_transaction_gas_paid = \
-                    self.__polygon_service.get_transaction_gas_paid(
-                        extraction.polygon_leg.bridge_transaction_hash
-                    )
-                if (extraction.polygon_leg.bridge_transaction_hash ==
-                        extraction.polygon_leg.swap_transaction_hash):
-                    extraction.polygon_leg.swap_transaction_gas_paid = \
-                        extraction.polygon_leg.bridge_transaction_gas_paid
-                else:
-                    extraction.polygon_leg.swap_transaction_gas_paid = \
-                        self.__polygon_service.get_transaction_gas_paid(
-                            extraction.polygon_leg.swap_transaction_hash
-                        )
             except Exception:
                 _logger.warning('unexpected exception for '
                                 f'{extraction}', exc_info=True)
+        if skip_non_cyclic_gas:
+            self.__fetch_gas_paid([
+                extraction for extraction in cross_chain_mev_extractions
+                if extraction.is_cyclic_arbitrage
+            ])
+        else:
+            self.__fetch_gas_paid(cross_chain_mev_extractions)
+
+    def __fetch_gas_paid(
+            self, cross_chain_mev_extractions: list[CrossChainMevExtraction]):
+        # The gas-paid values are prefetched with one batched receipt
+        # request per chain instead of one receipt RPC per transaction.
+        ethereum_hashes = set()
+        polygon_hashes = set()
+        for extraction in cross_chain_mev_extractions:
+            ethereum_hashes.add(extraction.ethereum_leg.transaction_hash)
+            polygon_hashes.add(extraction.polygon_leg.bridge_transaction_hash)
+            polygon_hashes.add(extraction.polygon_leg.swap_transaction_hash)
+        try:
+            self.__ethereum_gas_paid_cache.update(
+                self.__ethereum_service.get_transactions_gas_paid(
+                    sorted(ethereum_hashes -
+                           self.__ethereum_gas_paid_cache.keys())))
+            self.__polygon_gas_paid_cache.update(
+                self.__polygon_service.get_transactions_gas_paid(
+                    sorted(polygon_hashes -
+                           self.__polygon_gas_paid_cache.keys())))
+        except Exception:
+            _logger.warning('unable to prefetch the gas paid values',
+                            exc_info=True)
+        for extraction in cross_chain_mev_extractions:
+            try:
+                self.__fetch_extraction_gas_paid(extraction)
+            except Exception:
+                _logger.warning('unexpected exception for '
+                                f'{extraction}', exc_info=True)
+
+    def __fetch_extraction_gas_paid(self, extraction: CrossChainMevExtraction):
+        extraction.ethereum_leg.gas_paid = self.__get_ethereum_gas_paid(
+            extraction.ethereum_leg.transaction_hash)
+        extraction.polygon_leg.bridge_transaction_gas_paid = \
+            self.__get_polygon_gas_paid(
+                extraction.polygon_leg.bridge_transaction_hash)
+        if (extraction.polygon_leg.bridge_transaction_hash ==
+                extraction.polygon_leg.swap_transaction_hash):
+            extraction.polygon_leg.swap_transaction_gas_paid = \
+                extraction.polygon_leg.bridge_transaction_gas_paid
+        else:
+            extraction.polygon_leg.swap_transaction_gas_paid = \
+                self.__get_polygon_gas_paid(
+                    extraction.polygon_leg.swap_transaction_hash)
+
+    def __get_ethereum_gas_paid(self, transaction_hash: str) -> int:
+        gas_paid = self.__ethereum_gas_paid_cache.get(transaction_hash)
+        if gas_paid is None:
+            gas_paid = self.__ethereum_service.get_transaction_gas_paid(
+                transaction_hash)
+            self.__ethereum_gas_paid_cache[transaction_hash] = gas_paid
+        return gas_paid
+
+    def __get_polygon_gas_paid(self, transaction_hash: str) -> int:
+        gas_paid = self.__polygon_gas_paid_cache.get(transaction_hash)
+        if gas_paid is None:
+            gas_paid = self.__polygon_service.get_transaction_gas_paid(
+                transaction_hash)
+            self.__polygon_gas_paid_cache[transaction_hash] = gas_paid
+        return gas_paid
 
     def __analyze_from_ethereum_arbitrage(self,
                                           extraction: CrossChainMevExtraction):
         ethereum_token_started_wtih = extraction.ethereum_leg.swaps[0].token_in
-        polygon_token_ended_with = extraction.polygon_leg.swaps[-1].token_out
-        expected_polygon_token_ended_with = \
-            ([self.__polygon_bridge_interactor.get_polygon_mapped_token(
-                ethereum_token_started_wtih)] +
-                _ETH_TO_POLYGON_TOKEN_MAP[ethereum_token_started_wtih])
-        if (polygon_token_ended_with in expected_polygon_token_ended_with):
+        polygon_token_ended_with = \
+            extraction.polygon_leg.swaps[-1].token_out.lower()
+        mapped_polygon_token = \
+            self.__polygon_bridge_interactor.get_polygon_mapped_token(
+                ethereum_token_started_wtih).lower()
+        if (polygon_token_ended_with == mapped_polygon_token
+                or polygon_token_ended_with in _ETH_TO_POLYGON_TOKEN_SET.get(
+                    ethereum_token_started_wtih.lower(), frozenset())):
             extraction.is_cyclic_arbitrage = True
             profit_amount = (extraction.polygon_leg.swaps[-1].amount_out -
                              extraction.ethereum_leg.swaps[0].amount_in)
@@ -87,13 +152,15 @@ class CrossChainArbitrage:
 
     def __analyze_to_ethereum_arbitrage(self,
                                         extraction: CrossChainMevExtraction):
-        polygon_token_started_wtih = extraction.polygon_leg.swaps[0].token_in
+        polygon_token_started_wtih = \
+            extraction.polygon_leg.swaps[0].token_in.lower()
         ethereum_token_ended_with = extraction.ethereum_leg.swaps[-1].token_out
-        expected_polygon_started_with = \
-            ([self.__polygon_bridge_interactor.get_polygon_mapped_token(
-                ethereum_token_ended_with)] +
-                _ETH_TO_POLYGON_TOKEN_MAP[ethereum_token_ended_with])
-        if (polygon_token_started_wtih in expected_polygon_started_with):
+        mapped_polygon_token = \
+            self.__polygon_bridge_interactor.get_polygon_mapped_token(
+                ethereum_token_ended_with).lower()
+        if (polygon_token_started_wtih == mapped_polygon_token
+                or polygon_token_started_wtih in _ETH_TO_POLYGON_TOKEN_SET.get(
+                    ethereum_token_ended_with.lower(), frozenset())):
             extraction.is_cyclic_arbitrage = True
             profit_amount = (extraction.ethereum_leg.swaps[-1].amount_out -
                              extraction.polygon_leg.swaps[0].amount_in)
@@ -1,23 +1,24 @@
 """Module for matching cross-chain transactions.
 
 """
-import dataclasses
+import concurrent.futures
 import logging
+import threading
 import typing
 
 import web3.types
 
 from src.api_utilities.findblock import FindBlock
-from src.api_utilities.polygon_bridge import PolygonBridgeInteractor
 from src.api_utilities.polygon_bridge import PolygonBridgeInteractorError
-from src.blockchains.ethereum import EthereumService
+from src.api_utilities.polygon_bridge import get_polygon_bridge_interactor
+from src.blockchains import get_ethereum_service
+from src.blockchains import get_polygon_service
 from src.blockchains.ethereum import EthereumServiceError
-from src.blockchains.polygon import PolygonService
 from src.blockchains.swap import Swap
 from src.blockchains.swap import SwapProcessor
 from src.blockchains.swap import SwapProcessorError
 from src.config import get_config
-from src.database.access import get_block_timestamp
+from src.database.access import get_block_timestamps
 from src.domain import ADDRESS_ZERO
 from src.domain import CrossChainMevExtraction
 from src.domain import CrossChainMevFailedExtraction
@@ -35,6 +36,27 @@ _POLYGON_AVERAGE_BLOCK_TIME = 3
 _NUMBER_OF_BLOCKS_IN_5_HOURS = int(18000 / _POLYGON_AVERAGE_BLOCK_TIME)
 _NUMBER_OF_BLOCKS_IN_1_HOUR = int(3600 / _POLYGON_AVERAGE_BLOCK_TIME)
 
+_DIRECTION_MAP = {
+    PolygonBridgeInteraction.FROM_ETHEREUM: ('from', 'to'),
+    PolygonBridgeInteraction.TO_ETHEREUM: ('to', 'from')
+}
+"""The transfer log direction and reverse direction argument names per
+Polygon bridge interaction."""
+
+
+class _FindMatchResponse(typing.NamedTuple):
+    """The response received when trying to match a cross-chain
+    Ethereum-Polygon transaction. A named tuple rather than a
+    dataclass, since the instances are created in the hot matching
+    path and a tuple is cheaper to allocate.
+
+    """
+    is_arbitrage: bool
+    bridge_transaction_hash: str
+    swap_transaction_hash: typing.Optional[str] = None
+    swap: typing.Optional[list[Swap]] = None
+    second_bridge_transaction_hash: typing.Optional[str] = None
+
 
 class CrossChainMatchError(BaseError):
     """Exception class for cross-chain match errors.
@@ -55,29 +77,24 @@ class CrossChainMatch:
     """Class for matching cross-chain transactions.
 
     """
-    @dataclasses.dataclass
-    class __FindMatchResponse:
-        """The response received when trying to match a cross-chain
-        Ethereum-Polygon transaction.
-
-        """
-        is_arbitrage: bool
-        bridge_transaction_hash: str
-        swap_transaction_hash: typing.Optional[str] = None
-        swap: typing.Optional[list[Swap]] = None
-        second_bridge_transaction_hash: typing.Optional[str] = None
-
     def __init__(self):
         """Initialize and construct the instance.
 
         """
-        self.__ethereum_service = EthereumService(
-            get_config()['URL']['ethereum'])
-        self.__polygon_service = PolygonService(get_config()['URL']['polygon'])
+        self.__ethereum_service = get_ethereum_service()
+        self.__polygon_service = get_polygon_service()
         self.__find_block = FindBlock()
-        self.__polygon_bridge_interactor = PolygonBridgeInteractor()
+        self.__polygon_bridge_interactor = get_polygon_bridge_interactor()
         self.__ethereum_swap_processor = SwapProcessor(self.__ethereum_service)
         self.__polygon_swap_processor = SwapProcessor(self.__polygon_service)
+        self.__transfer_logs_cache: dict[str, tuple[
+            int, int, list[web3.types.EventData]]] = {}
+        self.__transfer_logs_cache_lock = threading.Lock()
+        # Auxiliary pool for overlapping independent RPCs within the
+        # processing of a single transaction.
+        self.__rpc_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=get_config().getint('Concurrency', 'match_workers',
+                                            fallback=16))
 
     def match_cross_chain_mev_transactions(
             self,
@@ -106,70 +123,100 @@ class CrossChainMatch:
         """
         cross_chain_mev_extractions: list[CrossChainMevExtraction] = []
         cross_chain_mev_failed: list[CrossChainMevFailedExtraction] = []
-        for key in block_to_cross_chain_mev_transactions:
-
-            block_timestamp = get_block_timestamp(key)
-            for transaction in block_to_cross_chain_mev_transactions[key]:
-                try:
-                    ethereum_swap_info = \
-                        self.__ethereum_swap_processor.process_transaction(
-                            transaction.transaction_hash)
-                    ethereum_searcher_eoa, ethereum_searcher_contract = \
-                        self.__ethereum_service.get_transaction_from_and_to(
-                            transaction.transaction_hash)
-                    assert transaction.polygon_bridge_interaction \
-                        is not PolygonBridgeInteraction.NONE
-                    if transaction.polygon_bridge_interaction \
-                            is PolygonBridgeInteraction.FROM_ETHEREUM:
-                        cross_chain_mev_extraction = \
-                            self.__match_from_ethereum(
-                                transaction, ethereum_searcher_eoa,
-                                ethereum_searcher_contract, ethereum_swap_info,
-                                block_timestamp)
-                    elif transaction.polygon_bridge_interaction \
-                            is PolygonBridgeInteraction.TO_ETHEREUM:
-                        cross_chain_mev_extraction = self.__match_to_ethereum(
-                            transaction, ethereum_searcher_eoa,
-                            ethereum_searcher_contract, ethereum_swap_info,
-                            block_timestamp)
-                    if (type(cross_chain_mev_extraction)
-                            is CrossChainMevExtraction):
-                        cross_chain_mev_extractions.append(
-                            cross_chain_mev_extraction)
-                    elif (type(cross_chain_mev_extraction)
-                          is CrossChainMevFailedExtraction):
-                        cross_chain_mev_failed.append(
-                            cross_chain_mev_extraction)
-                except EthereumServiceError:
-                    _logger.warning(
-                        'unable to match cross-chain MEV transaction. '
-                        'No token and amount log found for '
-                        f'{transaction.transaction_hash}')
-                except MatchedLogsError as error:
-                    _logger.warning(
-                        'unable to match cross-chain MEV transaction. '
-                        f'Logs found for {transaction.transaction_hash}: '
-                        f'{error.matched_logs}')
-                except SwapProcessorError as error:
-                    _logger.warning(
-                        'unable to match cross-chain MEV transaction. '
-                        'Multiple unrelated swaps detected for '
-                        f'{error.transaction_hash}')
-                except PolygonBridgeInteractorError:
-                    _logger.warning('unable to find child mapped token for ',
-                                    f'{transaction.transaction_hash}')
-                except Exception:
-                    _logger.warning(
-                        'unexpected exception for '
-                        f'{transaction.transaction_hash}', exc_info=True)
+        transactions_with_timestamps = []
+        block_timestamps = get_block_timestamps(
+            list(block_to_cross_chain_mev_transactions.keys()))
+        for block_number, transactions in \
+                block_to_cross_chain_mev_transactions.items():
+            block_timestamp = block_timestamps[block_number]
+            for transaction in transactions:
+                transactions_with_timestamps.append(
+                    (transaction, block_timestamp))
+        # The per-transaction matching is almost entirely RPC-bound, so
+        # the transactions are processed concurrently. The number of
+        # workers is kept configurable to respect RPC provider limits.
+        max_workers = get_config().getint('Concurrency', 'match_workers',
+                                          fallback=16)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self.__match_transaction, transaction,
+                                block_timestamp) for transaction,
+                block_timestamp in transactions_with_timestamps
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                cross_chain_mev_extraction = future.result()
+                if isinstance(cross_chain_mev_extraction,
+                              CrossChainMevExtraction):
+                    cross_chain_mev_extractions.append(
+                        cross_chain_mev_extraction)
+                elif isinstance(cross_chain_mev_extraction,
+                                CrossChainMevFailedExtraction):
+                    cross_chain_mev_failed.append(cross_chain_mev_extraction)
 
         return cross_chain_mev_extractions, cross_chain_mev_failed
 
+    def __match_transaction(
+            self, transaction: Transaction, block_timestamp: int) \
+            -> CrossChainMevExtraction | CrossChainMevFailedExtraction | None:
+        try:
+            # The swap processing and the from/to lookup are
+            # independent round trips, so one of them runs on the
+            # auxiliary pool while this thread performs the other.
+            ethereum_swap_info_future = self.__rpc_executor.submit(
+                self.__ethereum_swap_processor.process_transaction,
+                transaction.transaction_hash)
+            ethereum_searcher_eoa, ethereum_searcher_contract = \
+                self.__ethereum_service.get_transaction_from_and_to(
+                    transaction.transaction_hash)
+            ethereum_swap_info = ethereum_swap_info_future.result()
+            assert transaction.polygon_bridge_interaction \
+                is not PolygonBridgeInteraction.NONE
+            if transaction.polygon_bridge_interaction \
+                    is PolygonBridgeInteraction.FROM_ETHEREUM:
+                return self.__match_from_ethereum(transaction,
+                                                  ethereum_searcher_eoa,
+                                                  ethereum_searcher_contract,
+                                                  ethereum_swap_info,
+                                                  block_timestamp)
+            elif transaction.polygon_bridge_interaction \
+                    is PolygonBridgeInteraction.TO_ETHEREUM:
+                return self.__match_to_ethereum(transaction,
+                                                ethereum_searcher_eoa,
+                                                ethereum_searcher_contract,
+                                                ethereum_swap_info,
+                                                block_timestamp)
+        except EthereumServiceError:
+            _logger.warning('unable to match cross-chain MEV transaction. '
+                            'No token and amount log found for '
+                            f'{transaction.transaction_hash}')
+        except MatchedLogsError as error:
+            _logger.warning('unable to match cross-chain MEV transaction. '
+                            f'Logs found for {transaction.transaction_hash}: '
+                            f'{error.matched_logs}')
+        except SwapProcessorError as error:
+            _logger.warning('unable to match cross-chain MEV transaction. '
+                            'Multiple unrelated swaps detected for '
+                            f'{error.transaction_hash}')
+        except PolygonBridgeInteractorError:
+            _logger.warning('unable to find child mapped token for ',
+                            f'{transaction.transaction_hash}')
+        except Exception:
+            _logger.warning(
+                'unexpected exception for '
+                f'{transaction.transaction_hash}', exc_info=True)
+        return None
+
     def __match_from_ethereum(
             self, transaction: Transaction, searcher_eoa: str,
             searcher_contract: str, ethereum_swap_info: list[Swap],
             block_timestamp: int) \
             -> CrossChainMevExtraction | CrossChainMevFailedExtraction:
+        # The Polygon block lookup only depends on the block timestamp,
+        # so it overlaps with the bridge-information fetch.
+        polygon_block_number_future = self.__rpc_executor.submit(
+            self.__find_block.find_polygon_block_after_timestamp,
+            block_timestamp)
         etherem_token, receiver, amount = \
             self.__ethereum_service.get_from_ethereum_bridge_operation_information(  # noqa
                 transaction.transaction_hash)
@@ -181,7 +228,8 @@ class CrossChainMatch:
                 etherem_token)
         cross_chain_mev_extraction = \
             self.__process_cross_chain_mev_transaction_from_ethereum(
-                ethereum_leg, polygon_token, receiver, amount, block_timestamp)
+                ethereum_leg, polygon_token, receiver, amount,
+                polygon_block_number_future.result())
         return cross_chain_mev_extraction
 
     def __match_to_ethereum(
@@ -189,6 +237,9 @@ class CrossChainMatch:
             searcher_contract: str, ethereum_swap_info: list[Swap],
             block_timestamp: int) \
             -> CrossChainMevExtraction | CrossChainMevFailedExtraction:
+        polygon_block_number_future = self.__rpc_executor.submit(
+            self.__find_block.find_polygon_block_before_timestamp,
+            block_timestamp)
         etherem_token, sender, amount = \
             self.__ethereum_service.get_to_ethereum_bridge_operation_information(  # noqa
                 transaction.transaction_hash)
@@ -201,16 +252,13 @@ class CrossChainMatch:
         cross_chain_mev_extraction = \
             self.__process_cross_chain_mev_transaction_to_ethereum(
                 ethereum_leg, polygon_token, sender, amount,
-                block_timestamp,)
+                polygon_block_number_future.result())
         return cross_chain_mev_extraction
 
     def __process_cross_chain_mev_transaction_from_ethereum(
             self, ethereum_leg: EthereumLeg, polygon_token: str, receiver: str,
-            amount: int, ethereum_timestamp: int) \
+            amount: int, polygon_block_number: int) \
             -> CrossChainMevExtraction | CrossChainMevFailedExtraction:
-        polygon_block_number = \
-            self.__find_block.find_polygon_block_after_timestamp(
-                ethereum_timestamp)
         find_match_response = self.__find_from_ethereum_mev_transactions(
             polygon_block_number, polygon_token, receiver, amount)
         if find_match_response.is_arbitrage:
@@ -239,10 +287,7 @@ class CrossChainMatch:
 
     def __process_cross_chain_mev_transaction_to_ethereum(
             self, ethereum_leg: EthereumLeg, polygon_token: str, sender: str,
-            amount: int, ethereum_timestamp: int):
-        polygon_block_number = \
-            self.__find_block.find_polygon_block_before_timestamp(
-                ethereum_timestamp)
+            amount: int, polygon_block_number: int):
         find_match_response = self.__find_to_ethereum_mev_transactions(
             polygon_block_number, polygon_token, sender, amount)
         if find_match_response.is_arbitrage:
@@ -271,7 +316,7 @@ class CrossChainMatch:
 
     def __find_from_ethereum_mev_transactions(
             self, polygon_block_number: int, polygon_token: str, receiver: str,
-            amount: int) -> __FindMatchResponse:
+            amount: int) -> _FindMatchResponse:
         polygon_bridge_interaction = PolygonBridgeInteraction.FROM_ETHEREUM
         bridge_transaction_log = self.__match_polygon_transactions(
             polygon_block_number,
@@ -281,33 +326,34 @@ class CrossChainMatch:
             'transactionHash'].hex()
         bridge_transaction_block_number = bridge_transaction_log['blockNumber']
 
-        try:
-            swap_transaction_log = self.__match_polygon_transactions(
-                bridge_transaction_block_number,
-                bridge_transaction_block_number + _NUMBER_OF_BLOCKS_IN_1_HOUR,
-                polygon_token, amount, False, polygon_bridge_interaction,
-                receiver)
+        # A missed swap match is an expected outcome here, so the
+        # non-raising variant is used instead of catching
+        # MatchedLogsError as branch control.
+        swap_transaction_log = self.__try_match_polygon_transactions(
+            bridge_transaction_block_number,
+            bridge_transaction_block_number + _NUMBER_OF_BLOCKS_IN_1_HOUR,
+            polygon_token, amount, False, polygon_bridge_interaction, receiver)
+        if swap_transaction_log is not None:
             swap_transaction_hash = swap_transaction_log[
                 'transactionHash'].hex()
             swap = self.__polygon_swap_processor.process_transaction(
                 swap_transaction_hash)
-            return self.__FindMatchResponse(True, bridge_transaction_hash,
-                                            swap_transaction_hash, swap)
-        except MatchedLogsError:
-            bridge_back_transaction_log = self.__match_polygon_transactions(
-                bridge_transaction_block_number,
-                bridge_transaction_block_number + _NUMBER_OF_BLOCKS_IN_1_HOUR,
-                polygon_token, amount, True,
-                PolygonBridgeInteraction.TO_ETHEREUM, receiver)
-            bridge_back_transaction_hash = bridge_back_transaction_log[
-                'transactionHash'].hex()
-            return self.__FindMatchResponse(
-                False, bridge_transaction_hash,
-                second_bridge_transaction_hash=bridge_back_transaction_hash)
+            return _FindMatchResponse(True, bridge_transaction_hash,
+                                      swap_transaction_hash, swap)
+        bridge_back_transaction_log = self.__match_polygon_transactions(
+            bridge_transaction_block_number,
+            bridge_transaction_block_number + _NUMBER_OF_BLOCKS_IN_1_HOUR,
+            polygon_token, amount, True, PolygonBridgeInteraction.TO_ETHEREUM,
+            receiver)
+        bridge_back_transaction_hash = bridge_back_transaction_log[
+            'transactionHash'].hex()
+        return _FindMatchResponse(
+            False, bridge_transaction_hash,
+            second_bridge_transaction_hash=bridge_back_transaction_hash)
 
-    def __find_to_ethereum_mev_transactions(
-            self, polygon_block_number: int, polygon_token: str, sender: str,
-            amount: int) -> __FindMatchResponse:
+    def __find_to_ethereum_mev_transactions(self, polygon_block_number: int,
+                                            polygon_token: str, sender: str,
+                                            amount: int) -> _FindMatchResponse:
         polygon_bridge_interaction = PolygonBridgeInteraction.TO_ETHEREUM
         bridge_transaction_log = self.__match_polygon_transactions(
             polygon_block_number - _NUMBER_OF_BLOCKS_IN_5_HOURS,
@@ -320,62 +366,109 @@ class CrossChainMatch:
         swap = self.__polygon_swap_processor.process_transaction(
             bridge_transaction_hash)
         if swap:
-            return self.__FindMatchResponse(True, bridge_transaction_hash,
-                                            bridge_transaction_hash, swap)
+            return _FindMatchResponse(True, bridge_transaction_hash,
+                                      bridge_transaction_hash, swap)
         else:
-            try:
-                swap_transaction_log = self.__match_polygon_transactions(
-                    bridge_transaction_block_number -
-                    _NUMBER_OF_BLOCKS_IN_1_HOUR,
-                    bridge_transaction_block_number, polygon_token, amount,
-                    False, polygon_bridge_interaction, sender)
+            swap_transaction_log = self.__try_match_polygon_transactions(
+                bridge_transaction_block_number - _NUMBER_OF_BLOCKS_IN_1_HOUR,
+                bridge_transaction_block_number, polygon_token, amount, False,
+                polygon_bridge_interaction, sender)
+            if swap_transaction_log is not None:
                 swap_transaction_hash = swap_transaction_log[
                     'transactionHash'].hex()
                 swap = self.__polygon_swap_processor.process_transaction(
                     swap_transaction_hash)
-                return self.__FindMatchResponse(True, bridge_transaction_hash,
-                                                swap_transaction_hash, swap)
-            except MatchedLogsError:
-                bridge_back_transaction_log = \
-                    self.__match_polygon_transactions(
-                        bridge_transaction_block_number -
-                        _NUMBER_OF_BLOCKS_IN_1_HOUR,
-                        bridge_transaction_block_number, polygon_token, amount,
-                        True, PolygonBridgeInteraction.FROM_ETHEREUM, sender)
-                bridge_back_transaction_hash = bridge_back_transaction_log[
-                    'transactionHash'].hex()
-                return self.__FindMatchResponse(
-                    False, bridge_transaction_hash,
-                    second_bridge_transaction_hash=bridge_back_transaction_hash
-                )
+                return _FindMatchResponse(True, bridge_transaction_hash,
+                                          swap_transaction_hash, swap)
+            bridge_back_transaction_log = self.__match_polygon_transactions(
+                bridge_transaction_block_number - _NUMBER_OF_BLOCKS_IN_1_HOUR,
+                bridge_transaction_block_number, polygon_token, amount, True,
+                PolygonBridgeInteraction.FROM_ETHEREUM, sender)
+            bridge_back_transaction_hash = bridge_back_transaction_log[
+                'transactionHash'].hex()
+            return _FindMatchResponse(
+                False, bridge_transaction_hash,
+                second_bridge_transaction_hash=bridge_back_transaction_hash)
+
+    def __get_transfer_logs(self, from_block: int, to_block: int,
+                            polygon_token: str) \
+            -> list[web3.types.EventData]:
+        # Transactions from the same Ethereum block share overlapping
+        # Polygon block windows for the same token, so the last fetched
+        # window per token is kept and sliced instead of re-requesting
+        # the logs from the node.
+        with self.__transfer_logs_cache_lock:
+            cached = self.__transfer_logs_cache.get(polygon_token)
+        if cached is not None:
+            cached_from_block, cached_to_block, transfer_logs = cached
+            if cached_from_block <= from_block and to_block <= cached_to_block:
+                return [
+                    transfer_log for transfer_log in transfer_logs
+                    if from_block <= transfer_log['blockNumber'] <= to_block
+                ]
+        transfer_logs = self.__polygon_service.get_transfer_logs(
+            from_block, to_block, polygon_token)
+        with self.__transfer_logs_cache_lock:
+            self.__transfer_logs_cache[polygon_token] = (from_block, to_block,
+                                                         transfer_logs)
+        return transfer_logs
 
     def __match_polygon_transactions(
             self, from_block: int, to_block: int, polygon_token: str,
             amount: int, is_bridge_transaction: bool,
             polygon_bridge_interaction: PolygonBridgeInteraction,
             sender_or_receiver: str) -> web3.types.EventData:
-        transfer_logs = self.__polygon_service.get_transfer_logs(
-            from_block, to_block, polygon_token)
-        direction = ('from' if polygon_bridge_interaction
-                     is PolygonBridgeInteraction.FROM_ETHEREUM else 'to')
-        reverse_direction = ('to' if polygon_bridge_interaction
-                             is PolygonBridgeInteraction.FROM_ETHEREUM else
-                             'from')
-        matched_logs = []
+        matched_logs = self.__collect_matched_logs(from_block, to_block,
+                                                   polygon_token, amount,
+                                                   is_bridge_transaction,
+                                                   polygon_bridge_interaction,
+                                                   sender_or_receiver)
+        if len(matched_logs) != 1:
+            raise MatchedLogsError('unexpected number of matched logs',
+                                   matched_logs)
+        return matched_logs[0]
+
+    def __try_match_polygon_transactions(
+            self, from_block: int, to_block: int, polygon_token: str,
+            amount: int, is_bridge_transaction: bool,
+            polygon_bridge_interaction: PolygonBridgeInteraction,
+            sender_or_receiver: str) -> typing.Optional[web3.types.EventData]:
+        # Non-raising variant for the callers that treat a failed match
+        # as a regular branch instead of an error.
+        matched_logs = self.__collect_matched_logs(from_block, to_block,
+                                                   polygon_token, amount,
+                                                   is_bridge_transaction,
+                                                   polygon_bridge_interaction,
+                                                   sender_or_receiver)
+        return matched_logs[0] if len(matched_logs) == 1 else None
+
+    def __collect_matched_logs(
+            self, from_block: int, to_block: int, polygon_token: str,
+            amount: int, is_bridge_transaction: bool,
+            polygon_bridge_interaction: PolygonBridgeInteraction,
+            sender_or_receiver: str) -> list[web3.types.EventData]:
+        transfer_logs = self.__get_transfer_logs(from_block, to_block,
+                                                 polygon_token)
+        direction, reverse_direction = _DIRECTION_MAP[
+            polygon_bridge_interaction]
+        # The bounds stay in exact integer arithmetic; multiplying the
+        # 256-bit amount by a float would lose precision above 2**53.
+        amount_lower_bound = amount * 99 // 100
+        amount_upper_bound = amount * 101 // 100
+        matched_logs: list[web3.types.EventData] = []
         for transfer_log in transfer_logs:
-            if (transfer_log['args']['value'] <= (amount * 1.01)
-                    and transfer_log['args']['value'] >= (amount * 0.99)):
+            # Two matches are already an error, so any further
+            # traversal of the log list is wasted work.
+            if len(matched_logs) >= 2:
+                break
+            args = transfer_log['args']
+            if amount_lower_bound <= args['value'] <= amount_upper_bound:
                 if is_bridge_transaction:
-                    if (transfer_log['args'][direction] == ADDRESS_ZERO
-                            and transfer_log['args'][reverse_direction]
-                            == sender_or_receiver):
+                    if (args[direction] == ADDRESS_ZERO
+                            and args[reverse_direction] == sender_or_receiver):
                         matched_logs.append(transfer_log)
                 else:
-                    if (transfer_log['args'][direction] == sender_or_receiver
-                            and transfer_log['args'][reverse_direction]
-                            != ADDRESS_ZERO):
+                    if (args[direction] == sender_or_receiver
+                            and args[reverse_direction] != ADDRESS_ZERO):
                         matched_logs.append(transfer_log)
-        if len(matched_logs) != 1:
-            raise MatchedLogsError('unexpected number of matched logs',
-                                   matched_logs)
-        return matched_logs[0]
+        return matched_logs
@@ -2,27 +2,27 @@
 from different sources and saving it into the database.
 
 """
+import concurrent.futures
+import functools
+import itertools
 import logging
+import multiprocessing
 import os
-import queue
-import threading
-import typing
+
+import hexbytes
 
 from src.api_utilities.zeromev import ZeroMev
-from src.blockchains.ethereum import EthereumService
-from src.config import get_config
-from src.database.access import add_block
-from src.database.access import add_transactions
-from src.database.access import get_block_builder_address
+from src.blockchains import get_ethereum_service
+from src.database.access import add_blocks_with_transactions
+from src.database.access import get_block_builder_addresses
 from src.database.access import get_blocks_without_traces_processed
 from src.database.access import get_non_meved_blocks
-from src.database.access import get_saved_block_numbers
+from src.database.access import get_saved_block_number_ranges
 from src.database.access import update_block_with_trace_processed
 from src.database.access import update_blocks_with_mev
-from src.database.access import update_transaction_coinbase_transfer_value
-from src.database.access import update_transaction_with_bridge_information
-from src.database.access import update_transaction_with_mev
-from src.domain import Block
+from src.database.access import update_transactions_coinbase_transfer_value
+from src.database.access import update_transactions_with_bridge_information
+from src.database.access import update_transactions_with_mev
 from src.domain import BlockTrace
 from src.domain import PolygonBridgeInteraction
 from src.domain import TransactionTrace
@@ -31,10 +31,31 @@ from src.exceptions import BaseError
 _logger = logging.getLogger(__name__)
 """Logger for this module."""
 
+_BLOCK_FETCH_BATCH_SIZE = 100
+"""The number of blocks requested per batched JSON-RPC request."""
+
+# The address is kept lowercased since the raw JSON-RPC trace
+# responses report addresses in lowercase.
 _POLYGON_ROOT_CHAIN_MANAGER_PROXY = \
-    '0xA0c68C638235ee32657e8f720a23ceC1bFc77C77'
-_POLYGON_BRIDGE_FROM_ETHEREUM_FUNCTION_SELECTORS = ['0x4faa8a26', '0xe3dec8fb']
-_POLYGON_BRIDGE_TO_ETHEREUM_FUNCTION_SELECTORS = ['0x3805550f']
+    '0xa0c68c638235ee32657e8f720a23cec1bfc77c77'
+# The selectors are kept as raw bytes so that the trace inputs can be
+# matched without a bytes-to-hex-string conversion per trace.
+_POLYGON_BRIDGE_FROM_ETHEREUM_FUNCTION_SELECTORS = frozenset(
+    {bytes.fromhex('4faa8a26'),
+     bytes.fromhex('e3dec8fb')})
+_POLYGON_BRIDGE_TO_ETHEREUM_FUNCTION_SELECTORS = frozenset(
+    {bytes.fromhex('3805550f')})
+_BRIDGE_INTERACTION_BY_SELECTOR = {
+    **{
+        selector: PolygonBridgeInteraction.FROM_ETHEREUM
+        for selector in _POLYGON_BRIDGE_FROM_ETHEREUM_FUNCTION_SELECTORS
+    },
+    **{
+        selector: PolygonBridgeInteraction.TO_ETHEREUM
+        for selector in _POLYGON_BRIDGE_TO_ETHEREUM_FUNCTION_SELECTORS
+    }
+}
+"""The Polygon bridge interaction per bridge function selector."""
 
 
 class DataFetcherError(BaseError):
@@ -52,9 +73,18 @@ class DataFetcher():
         """Construct an instance.
 
         """
-        self.__ethereum_service = EthereumService(
-            get_config()['URL']['ethereum'])
+        self.__ethereum_service = get_ethereum_service()
         self.__zero_mev = ZeroMev()
+        # One worker pool is shared by all the fetching entry points
+        # instead of spawning and joining a fresh pool per call.
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=os.cpu_count() or 4, thread_name_prefix='fetch')
+
+    def close(self) -> None:
+        """Shut down the worker pool of the data fetcher.
+
+        """
+        self.__executor.shutdown()
 
     def fetch_block_data(self, block_number_start: int,
                          block_number_end: int) -> None:
@@ -70,52 +100,53 @@ class DataFetcher():
         """
         _logger.info('the number of requested blocks: '
                      f'{block_number_end - block_number_start + 1}')
-        saved_block_numbers = get_saved_block_numbers(block_number_start,
-                                                      block_number_end)
-        blocks_to_add = sorted(
-            list(
-                set(range(block_number_start, block_number_end + 1)) -
-                set(saved_block_numbers)))
+        # The saved blocks come back as consecutive ranges from the
+        # islands-and-gaps query, so the missing blocks are the gaps
+        # between them; nothing proportional to the saved blocks is
+        # materialized in Python.
+        saved_block_ranges = get_saved_block_number_ranges(
+            block_number_start=block_number_start,
+            block_number_end=block_number_end)
+        blocks_to_add: list[int] = []
+        next_block_number = block_number_start
+        for range_start, range_end in saved_block_ranges:
+            blocks_to_add.extend(range(next_block_number, range_start))
+            next_block_number = range_end + 1
+        blocks_to_add.extend(range(next_block_number, block_number_end + 1))
         _logger.info('the number of blocks that need '
                      f'to be added: {len(blocks_to_add)}')
-
-        q: queue.Queue = queue.Queue()
-
-        def worker():
-            not_done = True
-            while not_done:
-                try:
-                    block_number = q.get(block=False)
-                    block = \
-                        self.__ethereum_service.fetch_block(block_number)
-                    _logger.info(f'saving block {block_number}')
-                    self.__save_block_data(block)
-                    q.task_done()
-                except queue.Empty:
-                    not_done = False
-                except Exception:
-                    q.task_done()
-                    _logger.warning(
-                        f'error when fetching block {block_number} ',
-                        exc_info=True)
-                    q.put(block_number)
-
-        for block_number in blocks_to_add:
-            q.put(block_number)
-
-        consumers = [
-            threading.Thread(target=worker, daemon=True)
-            for _ in range(0,
-                           os.cpu_count() or 4)
+        # The blocks are requested in batches of 100 per JSON-RPC
+        # round trip, with the batches spread across worker threads.
+        batches = [
+            blocks_to_add[i:i + _BLOCK_FETCH_BATCH_SIZE]
+            for i in range(0, len(blocks_to_add), _BLOCK_FETCH_BATCH_SIZE)
         ]
-
-        for consumer_ in consumers:
-            consumer_.start()
-
-        for consumer_ in consumers:
-            consumer_.join()
-
-        q.join()
+        # Failed batches are collected instead of being retried
+        # forever; the transient failures are already retried at the
+        # HTTP level and anything still failing is surfaced.
+        failed_batches = [
+            batch for batch, saved in zip(
+                batches,
+                self.__executor.map(self.__fetch_and_save_blocks, batches))
+            if not saved
+        ]
+        if len(failed_batches) > 0:
+            raise DataFetcherError(
+                'unable to fetch the blocks of the batches starting at '
+                f'{[batch[0] for batch in failed_batches]}')
+
+    def __fetch_and_save_blocks(self, block_numbers: list[int]) -> bool:
+        try:
+            blocks = self.__ethereum_service.fetch_blocks_batch(block_numbers)
+            _logger.info(f'saving {len(blocks)} blocks from '
+                         f'{block_numbers[0]}')
+            add_blocks_with_transactions(blocks)
+            return True
+        except Exception:
+            _logger.warning(
+                f'error when saving blocks from {block_numbers[0]}',
+                exc_info=True)
+            return False
 
     def fetch_mev_block_data(self, block_number_start: int,
                              block_number_end: int) -> None:
@@ -140,11 +171,18 @@ class DataFetcher():
             'the number of blocks that need to have the MEV details '
             f'added: {sum(len(sublist) for sublist in blocks_to_mev)}')
 
+        failed_batch_starts = []
         for interval in blocks_to_mev:
             if len(interval) == 1:
-                self.__fetch_mev_block_data(interval[0], interval[0])
+                failed_batch_starts += self.__fetch_mev_block_data(
+                    interval[0], interval[0])
             else:
-                self.__fetch_mev_block_data(interval[0], interval[-1])
+                failed_batch_starts += self.__fetch_mev_block_data(
+                    interval[0], interval[-1])
+        if len(failed_batch_starts) > 0:
+            raise DataFetcherError(
+                'unable to fetch the MEV data of the batches starting at '
+                f'{failed_batch_starts}')
 
     def fetch_and_process_traces(self, block_number_start: int,
                                  block_number_end: int) -> None:
@@ -172,17 +210,16 @@ class DataFetcher():
 
         self.__fetch_and_process_block_traces(blocks_to_fetch_traces_for)
 
-    def __save_block_data(self, block: Block) -> None:
-        add_block(block)
-        add_transactions(int(block['number']),
-                         typing.cast(list, block['transactions']))
-
     def __check_blocks_are_fetched(self, block_number_start: int,
                                    block_number_end: int) -> None:
-        saved_blocks = get_saved_block_numbers(block_number_start,
-                                               block_number_end)
+        saved_block_ranges = get_saved_block_number_ranges(
+            block_number_start=block_number_start,
+            block_number_end=block_number_end)
+        number_of_saved_blocks = sum(
+            range_end - range_start + 1
+            for range_start, range_end in saved_block_ranges)
         non_saved_blocks_number = (block_number_end - block_number_start + 1 -
-                                   len(saved_blocks))
+                                   number_of_saved_blocks)
         if non_saved_blocks_number != 0:
             raise DataFetcherError(
                 f'{non_saved_blocks_number} blocks are not fetched')
@@ -192,161 +229,164 @@ class DataFetcher():
         if len(block_numbers) == 0:
             return []
         block_numbers.sort()
-
-        result = []
-        temp = [block_numbers[0]]
-
-        for i in range(1, len(block_numbers)):
-            if block_numbers[i] == temp[-1] + 1:
-                temp.append(block_numbers[i])
-            else:
-                result.append(temp)
-                temp = [block_numbers[i]]
-
-        result.append(temp)
-
-        return result
+        # Consecutive block numbers share the same difference to their
+        # position, so grouping by that difference yields the runs
+        # without appending element by element to temporary lists.
+        return [[
+            block_number for _, block_number in group
+        ] for _, group in itertools.groupby(
+            enumerate(block_numbers), lambda indexed: indexed[1] - indexed[0])]
 
     def __fetch_mev_block_data(self, block_number_start: int,
-                               block_number_end: int) -> None:
+                               block_number_end: int) -> list[int]:
         number_of_blocks = block_number_end - block_number_start + 1
-        number_of_100_batches = int(number_of_blocks / 100)
-        q: queue.Queue = queue.Queue()
-
-        def worker():
-            not_done = True
-            while not_done:
-                try:
-                    block_number_start_ = q.get(block=False)
-                    if block_number_start_ + 100 <= block_number_end:
-                        block_number_end_ = block_number_start_ + 100
-                    else:
-                        block_number_end_ = block_number_end
-                    mev_transactions = \
-                        self.__zero_mev.fetch_mev_transactions_for_blocks(
-                            block_number_start_,
-                            block_number_end_ - block_number_start_)
-                    for mev_transaction in mev_transactions:
-                        _logger.info(
-                            f'updating MEV transaction in block '
-                            f'{mev_transaction.block_number} with index '
-                            f'{mev_transaction.transactiion_index}')
-                        update_transaction_with_mev(mev_transaction)
-                    _logger.info('updating MEV blocks from block '
-                                 f'{block_number_start_} to block '
-                                 f'{block_number_end_}')
-                    update_blocks_with_mev(block_number_start_,
-                                           block_number_end_)
-                    q.task_done()
-                except queue.Empty:
-                    not_done = False
-                except Exception:
-                    q.task_done()
-                    _logger.warning(
-                        'error when fetching MEV block data '
-                        f'from {block_number_start_}', exc_info=True)
-                    q.put(block_number_start_)
-
-        q.put(block_number_start)
-        for number_of_100_batch in range(1, number_of_100_batches + 1):
-            q.put(block_number_start + number_of_100_batch * 100)
-
-        consumers = [
-            threading.Thread(target=worker, daemon=True)
-            for _ in range(0,
-                           os.cpu_count() or 4)
+        # Each batch is a (start, size) pair with the last batch
+        # clipped to the requested range, so no empty batch is
+        # submitted when the range is a multiple of 100.
+        batches = [(block_number_start + i * 100,
+                    min(100, number_of_blocks - i * 100))
+                   for i in range((number_of_blocks + 99) // 100)]
+        results = list(
+            self.__executor.map(self.__fetch_and_update_mev_batch, batches))
+        successful_batch_starts = [
+            batch_start for (batch_start, _), updated in zip(batches, results)
+            if updated
+        ]
+        # Contiguous runs of successful batches are marked with one
+        # range update each instead of one update per 100-block batch.
+        for _, group in itertools.groupby(
+                enumerate(successful_batch_starts),
+                lambda indexed: indexed[1] - indexed[0] * 100):
+            run_batch_starts = [batch_start for _, batch_start in group]
+            run_end = min(run_batch_starts[-1] + 99, block_number_end)
+            _logger.info('updating MEV blocks from block '
+                         f'{run_batch_starts[0]} to block {run_end}')
+            update_blocks_with_mev(run_batch_starts[0], run_end)
+        return [
+            batch_start for (batch_start, _), updated in zip(batches, results)
+            if not updated
         ]
 
-        for consumer_ in consumers:
-            consumer_.start()
-
-        for consumer_ in consumers:
-            consumer_.join()
-
-        q.join()
+    def __fetch_and_update_mev_batch(self, batch: tuple[int, int]) -> bool:
+        batch_start, batch_size = batch
+        try:
+            mev_transactions = \
+                self.__zero_mev.fetch_mev_transactions_for_blocks(
+                    batch_start, batch_size)
+            if len(mev_transactions) > 0:
+                _logger.info(f'updating {len(mev_transactions)} MEV '
+                             f'transactions from block {batch_start}')
+                update_transactions_with_mev(mev_transactions)
+            return True
+        except Exception:
+            _logger.warning(
+                'error when fetching MEV block data '
+                f'from {batch_start}', exc_info=True)
+            return False
 
     def __fetch_and_process_block_traces(self, block_numbers: list[int]):
-        q: queue.Queue = queue.Queue()
-
-        def worker():
-            not_done = True
-            while not_done:
-                try:
-                    block_number = q.get(block=False)
-                    tx_traces = \
-                        self.__ethereum_service.fetch_transaction_traces(
-                            block_number)
-                    block_trace = BlockTrace(block_number, tx_traces)
-                    self.__process_block_trace(block_trace)
-                    update_block_with_trace_processed(block_number)
-                    q.task_done()
-                except queue.Empty:
-                    not_done = False
-                except Exception:
-                    q.task_done()
-                    _logger.warning(
-                        'error when fetching traces for block number '
-                        f'{block_number}', exc_info=True)
-                    q.put(block_number)
-
-        for block_number in block_numbers:
-            q.put(block_number)
-
-        consumers = [
-            threading.Thread(target=worker, daemon=True)
-            for _ in range(0,
-                           os.cpu_count() or 4)
-        ]
-
-        for consumer_ in consumers:
-            consumer_.start()
-
-        for consumer_ in consumers:
-            consumer_.join()
-
-        q.join()
-
-    def __process_block_trace(self, block_trace: BlockTrace) -> None:
-        builder_address = get_block_builder_address(block_trace.block_number)
-        for transaction_trace in block_trace.transaction_traces:
-            polygon_bridge_interaction, sent_value = \
-                self.__process_transaction_traces(
-                    transaction_trace, builder_address)
-            transaction_hash = transaction_trace['transactionHash']
-            if (polygon_bridge_interaction
-                    is not PolygonBridgeInteraction.NONE):
-                update_transaction_with_bridge_information(
-                    transaction_hash, polygon_bridge_interaction)
-            if sent_value > 0:
-                _logger.info('updating coinbase transfer for block '
-                             f'{block_trace.block_number} '
-                             f'transaction hash {transaction_hash.hex()} '
-                             f'with value {sent_value}')
-                update_transaction_coinbase_transfer_value(
-                    transaction_hash, str(sent_value))
-
-    def __process_transaction_traces(
-            self, transaction_trace: TransactionTrace,
-            builder_address: str) -> tuple[PolygonBridgeInteraction, int]:
-        sent_value = 0
-        polygon_bridge_interaction = PolygonBridgeInteraction.NONE
-        for trace in transaction_trace['trace']:
-            # polygon bridge
-            if (polygon_bridge_interaction is PolygonBridgeInteraction.NONE
-                    and _POLYGON_ROOT_CHAIN_MANAGER_PROXY
-                    == trace['action'].get('to')):
-                # we extract the function selector from the input data
-                # the function selector is the first 4 bytes of it
-                function_selector = trace['action']['input'][:4].hex()
-                if function_selector in \
-                        _POLYGON_BRIDGE_FROM_ETHEREUM_FUNCTION_SELECTORS:
-                    polygon_bridge_interaction = \
-                        PolygonBridgeInteraction.FROM_ETHEREUM
-                elif function_selector in \
-                        _POLYGON_BRIDGE_TO_ETHEREUM_FUNCTION_SELECTORS:
-                    polygon_bridge_interaction = \
-                        PolygonBridgeInteraction.TO_ETHEREUM
-            # coinbase transfer
-            if trace['action'].get('to') == builder_address:
-                sent_value += trace['action']['value']
-        return polygon_bridge_interaction, sent_value
+        # The builder addresses for the whole batch are pre-loaded
+        # with one query instead of one SELECT per block.
+        builder_addresses = get_block_builder_addresses(block_numbers)
+        # The trace fetching is network bound and stays on threads,
+        # while the trace walking is CPU-bound Python and is offloaded
+        # to a process pool so it can scale past the GIL. The workers
+        # are spawned rather than forked: a fork taken while a sibling
+        # fetch thread holds the logging handler lock would leave the
+        # child deadlocked on its first log record.
+        with concurrent.futures.ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context(
+                    'spawn')) as process_executor:
+            failed_block_numbers = [
+                block_number for block_number, processed in zip(
+                    block_numbers,
+                    self.__executor.map(
+                        functools.partial(
+                            self.__fetch_and_process_one_block_trace,
+                            builder_addresses=builder_addresses,
+                            process_executor=process_executor), block_numbers))
+                if not processed
+            ]
+        if len(failed_block_numbers) > 0:
+            raise DataFetcherError('unable to process the traces of the '
+                                   f'blocks {failed_block_numbers}')
+
+    def __fetch_and_process_one_block_trace(
+            self, block_number: int, builder_addresses: dict[int, str],
+            process_executor: concurrent.futures.Executor) -> bool:
+        try:
+            tx_traces = self.__ethereum_service.fetch_transaction_traces(
+                block_number)
+            block_trace = BlockTrace(block_number, tx_traces)
+            bridge_updates, coinbase_updates = process_executor.submit(
+                _process_block_trace, block_trace,
+                builder_addresses[block_number]).result()
+            # The database writes stay in the parent process; the
+            # SQLite connections must not cross process boundaries.
+            if len(bridge_updates) > 0:
+                update_transactions_with_bridge_information(bridge_updates)
+            if len(coinbase_updates) > 0:
+                update_transactions_coinbase_transfer_value(coinbase_updates)
+            update_block_with_trace_processed(block_number)
+            return True
+        except Exception:
+            _logger.warning(
+                'error when fetching traces for block number '
+                f'{block_number}', exc_info=True)
+            return False
+
+
+def _process_block_trace(
+    block_trace: BlockTrace, builder_address: str
+) -> tuple[list[tuple[bytes, PolygonBridgeInteraction]], list[tuple[bytes,
+                                                                    str]]]:
+    # The updates are collected across the whole block and written
+    # with two batched statements instead of one statement per
+    # transaction. The function is module level so that the process
+    # pool workers can pickle it without dragging the fetcher along.
+    bridge_updates: list[tuple[bytes, PolygonBridgeInteraction]] = []
+    coinbase_updates: list[tuple[bytes, str]] = []
+    builder_address = builder_address.lower()
+    for transaction_trace in block_trace.transaction_traces:
+        polygon_bridge_interaction, sent_value = \
+            _process_transaction_traces(transaction_trace, builder_address)
+        transaction_hash = transaction_trace['transactionHash']
+        if polygon_bridge_interaction is not PolygonBridgeInteraction.NONE:
+            bridge_updates.append((hexbytes.HexBytes(transaction_hash),
+                                   polygon_bridge_interaction))
+        if sent_value > 0:
+            _logger.info('updating coinbase transfer for block '
+                         f'{block_trace.block_number} '
+                         f'transaction hash {transaction_hash} '
+                         f'with value {sent_value}')
+            coinbase_updates.append(
+                (hexbytes.HexBytes(transaction_hash), str(sent_value)))
+    return bridge_updates, coinbase_updates
+
+
+def _process_transaction_traces(
+        transaction_trace: TransactionTrace,
+        builder_address: str) -> tuple[PolygonBridgeInteraction, int]:
+    # The module globals are bound to locals before the loop;
+    # pathological transactions have thousands of sub-calls and local
+    # loads are the cheapest name accesses CPython has.
+    bridge_address = _POLYGON_ROOT_CHAIN_MANAGER_PROXY
+    no_interaction = PolygonBridgeInteraction.NONE
+    interaction_by_selector = _BRIDGE_INTERACTION_BY_SELECTOR.get
+    sent_value = 0
+    polygon_bridge_interaction = no_interaction
+    for trace in transaction_trace['trace']:
+        # The action and its recipient are bound once per trace.
+        action = trace['action']
+        to = action.get('to')
+        # polygon bridge
+        if (polygon_bridge_interaction is no_interaction
+                and to == bridge_address):
+            # we extract the function selector from the input data
+            # the function selector is the first 4 bytes of it
+            polygon_bridge_interaction = interaction_by_selector(
+                bytes.fromhex(action['input'][2:10]), no_interaction)
+        # coinbase transfer
+        if to == builder_address:
+            sent_value += int(action['value'], 16)
+    return polygon_bridge_interaction, sent_value
@@ -2,11 +2,13 @@
 
 """
 import logging
-import time
 
 import requests
+import requests.adapters
+import urllib3.util.retry
 
-from src import REQUEST_RETRY_SECONDS
+from src.cache import PersistentCache
+from src.retry import retry_request
 
 _FIND_BLOCK_URL = 'https://api.findblock.xyz/v1/'
 _POLYGON_CHAIN_ID = 137
@@ -27,8 +29,25 @@ class FindBlock:
 
         """
         # Using the same request session for caching/improved performance.
+        # The session is shared by all the worker threads, so the
+        # connection pool is sized to keep the concurrent requests on
+        # keep-alive connections.
         self.__request_session = requests.Session()
-
+        # Transient failures are retried with exponential backoff at
+        # the urllib3 level before the retry_request decorator kicks in.
+        retry = urllib3.util.retry.Retry(
+            total=5, backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET'}))
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry,
+                                                pool_connections=16,
+                                                pool_maxsize=64)
+        self.__request_session.mount('https://', adapter)
+        # The timestamp-to-block mapping never changes for historical
+        # blocks, so the lookups are cached on disk across runs.
+        self.__block_cache = PersistentCache('findblock_blocks')
+
+    @retry_request
     def find_polygon_block_before_timestamp(self, timestamp: int) -> int:
         """Find the polygon block before the given timestamp.
 
@@ -43,20 +62,17 @@ class FindBlock:
             The block number.
 
         """
-        while True:
-            try:
-                response = self.__request_session.get(
-                    f'{_FIND_BLOCK_URL}{_BEFORE_TIMESTAMP_RESOURCE}'
-                    f'{timestamp}?'
-                    'inclusive=true')
-                return response.json()['number']
-            except Exception as error:
-                _logger.error(
-                    f'unable to fetch get polygon before {timestamp}; '
-                    f'retrying in {REQUEST_RETRY_SECONDS}')
-                _logger.error(f'error reason: {error}')
-                time.sleep(REQUEST_RETRY_SECONDS)
-
+        cached_block_number = self.__block_cache.get(f'before:{timestamp}')
+        if cached_block_number is not None:
+            return int(cached_block_number)
+        response = self.__request_session.get(
+            f'{_FIND_BLOCK_URL}{_BEFORE_TIMESTAMP_RESOURCE}{timestamp}?'
+            'inclusive=true')
+        block_number = response.json()['number']
+        self.__block_cache.set(f'before:{timestamp}', str(block_number))
+        return block_number
+
+    @retry_request
     def find_polygon_block_after_timestamp(self, timestamp: int):
         """Find the polygon block after the given timestamp.
 
@@ -71,15 +87,12 @@ class FindBlock:
             The block number.
 
         """
-        while True:
-            try:
-                response = self.__request_session.get(
-                    f'{_FIND_BLOCK_URL}{_AFTER_TIMESTAMP_RESOURCE}{timestamp}?'
-                    'inclusive=true')
-                return response.json()['number']
-            except Exception as error:
-                _logger.error(
-                    f'unable to fetch get polygon after {timestamp}; '
-                    f'retrying in {REQUEST_RETRY_SECONDS}')
-                _logger.error(f'error reason: {error}')
-                time.sleep(REQUEST_RETRY_SECONDS)
+        cached_block_number = self.__block_cache.get(f'after:{timestamp}')
+        if cached_block_number is not None:
+            return int(cached_block_number)
+        response = self.__request_session.get(
+            f'{_FIND_BLOCK_URL}{_AFTER_TIMESTAMP_RESOURCE}{timestamp}?'
+            'inclusive=true')
+        block_number = response.json()['number']
+        self.__block_cache.set(f'after:{timestamp}', str(block_number))
+        return block_number
@@ -1,14 +1,25 @@
 """Module for interacting with the Polygon bridge API.
 
 """
+import functools
+import time
+import typing
+
+import orjson
 import requests
 import web3
 
+from src.cache import PersistentCache
 from src.exceptions import BaseError
 
 _TOKEN_MAPPING_API = ('https://api-polygon-tokens.polygon.technology/'
                       'tokenlists/mapped.tokenlist.json')
 
+_POLYGON_CHAIN_ID = 137
+
+_TOKEN_MAPPING_MAX_AGE_SECONDS = 86400
+"""How long the on-disk token mapping is used before it is refetched."""
+
 
 class PolygonBridgeInteractorError(BaseError):
     """Exception class for polygon bridge interactor errors.
@@ -24,8 +35,44 @@ class PolygonBridgeInteractor:
         """Initialize and construct the instance.
 
         """
+        # The normalized mapping is kept on disk for a day, so process
+        # restarts and sibling worker processes skip refetching and
+        # reparsing the whole token list.
+        self.__token_mapping_cache = PersistentCache('polygon_token_mapping')
+        mapped_tokens = self.__load_cached_mapped_tokens()
+        if mapped_tokens is None:
+            mapped_tokens = self.__fetch_mapped_tokens()
+            self.__token_mapping_cache.set(
+                'mapped_tokens',
+                orjson.dumps(mapped_tokens).decode())
+            self.__token_mapping_cache.set('fetched_at', str(int(time.time())))
+        self.__mapped_tokens = mapped_tokens
+
+    def __load_cached_mapped_tokens(self) -> typing.Optional[dict[str, str]]:
+        fetched_at = self.__token_mapping_cache.get('fetched_at')
+        if (fetched_at is None or time.time() - int(fetched_at)
+                > _TOKEN_MAPPING_MAX_AGE_SECONDS):
+            return None
+        mapped_tokens = self.__token_mapping_cache.get('mapped_tokens')
+        if mapped_tokens is None:
+            return None
+        return orjson.loads(mapped_tokens)
+
+    def __fetch_mapped_tokens(self) -> dict[str, str]:
         response = requests.get(_TOKEN_MAPPING_API)
-        self.__token_mapping = response.json()['tokens']
+        # The token list is normalized once into a dictionary keyed by
+        # the lowercased origin address, so every lookup afterwards is
+        # a single dictionary access instead of a scan of the list.
+        mapped_tokens: dict[str, str] = {}
+        for token in response.json()['tokens']:
+            origin_token_address = token['originTokenAddress'].lower()
+            for wrapped_token in token['wrappedTokens']:
+                if wrapped_token['chainId'] == _POLYGON_CHAIN_ID:
+                    mapped_tokens[origin_token_address] = \
+                        web3.Web3.to_checksum_address(
+                            wrapped_token['wrappedTokenAddress'])
+                    break
+        return mapped_tokens
 
     def get_polygon_mapped_token(self, ethereum_token: str) -> str:
         """Get the child token mapped to the ethereum root token.
@@ -36,12 +83,23 @@ class PolygonBridgeInteractor:
             The address of the Ethereum token.
 
         """
-        for token_ in self.__token_mapping:
-            if token_['originTokenAddress'].lower() \
-                    == ethereum_token.lower():
-                for token__ in token_['wrappedTokens']:
-                    if token__['chainId'] == 137:
-                        return web3.Web3.to_checksum_address(
-                            token__['wrappedTokenAddress'])
-        raise PolygonBridgeInteractorError(
-            f'no mapped token found for {ethereum_token}')
+        mapped_token = self.__mapped_tokens.get(ethereum_token.lower())
+        if mapped_token is None:
+            raise PolygonBridgeInteractorError(
+                f'no mapped token found for {ethereum_token}')
+        return mapped_token
+
+
+@functools.lru_cache
+def get_polygon_bridge_interactor() -> PolygonBridgeInteractor:
+    """Get the shared Polygon bridge interactor. The interactor fetches
+    the whole token mapping when constructed, so it is created only
+    once per process.
+
+    Returns
+    -------
+    PolygonBridgeInteractor
+        The Polygon bridge interactor.
+
+    """
+    return PolygonBridgeInteractor()
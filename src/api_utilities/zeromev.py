@@ -3,13 +3,15 @@
 """
 import dataclasses
 import logging
-import time
 
+import orjson
 import requests
+import requests.adapters
+import urllib3.util.retry
 
-from src import REQUEST_RETRY_SECONDS
 from src.domain import MevType
 from src.exceptions import BaseError
+from src.retry import retry_request
 
 _ZEROMEV_BLOCKS_URL = 'https://data.zeromev.org/v1/mevBlock'
 
@@ -27,7 +29,9 @@ class ZeroMev:
     """ZeroMev interactor class.
 
     """
-    @dataclasses.dataclass
+    # The slots=True option drops the per-instance __dict__; thousands
+    # of these are created per 100-block batch.
+    @dataclasses.dataclass(slots=True)
     class TransactionResponse:
         """Response data for MEV transactions.
 
@@ -41,8 +45,23 @@ class ZeroMev:
 
         """
         # Using the same request session for caching/improved performance.
+        # The session is shared by all the worker threads, so the
+        # connection pool is sized to keep the concurrent requests on
+        # keep-alive connections.
         self.__request_session = requests.Session()
-
+        # Transient failures (including ZeroMev throttling) are
+        # retried with exponential backoff at the urllib3 level before
+        # the retry_request decorator kicks in.
+        retry = urllib3.util.retry.Retry(
+            total=5, backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'GET'}))
+        adapter = requests.adapters.HTTPAdapter(max_retries=retry,
+                                                pool_connections=16,
+                                                pool_maxsize=64)
+        self.__request_session.mount('https://', adapter)
+
+    @retry_request
     def fetch_mev_transactions_for_blocks(
             self, block_number_start: int,
             number_of_blocks: int) -> list[TransactionResponse]:
@@ -70,20 +89,15 @@ class ZeroMev:
             'count': number_of_blocks
         }
 
-        while True:
-            response = self.__request_session.get(_ZEROMEV_BLOCKS_URL,
-                                                  params=payload)
-            if response.status_code == 200:
-                return [
-                    self.TransactionResponse(
-                        block_number=transaction['block_number'],
-                        transactiion_index=transaction['tx_index'],
-                        mev_type=MevType.from_name(transaction['mev_type']))
-                    for transaction in response.json()
-                ]
-            else:
-                _logger.error(
-                    f'unable to fetch {number_of_blocks} '
-                    f'MEV blocks from {block_number_start}; ',
-                    f'retrying in {REQUEST_RETRY_SECONDS}')
-                time.sleep(REQUEST_RETRY_SECONDS)
+        response = self.__request_session.get(_ZEROMEV_BLOCKS_URL,
+                                              params=payload)
+        response.raise_for_status()
+        # orjson parses the payload noticeably faster than the stdlib
+        # json behind response.json().
+        return [
+            self.TransactionResponse(
+                block_number=transaction['block_number'],
+                transactiion_index=transaction['tx_index'],
+                mev_type=MevType.from_name(transaction['mev_type']))
+            for transaction in orjson.loads(response.content)
+        ]
@@ -0,0 +1,14 @@
+"""Module for initializing the application requirements shared by
+the entry points.
+
+"""
+from src.database import initialize_database
+from src.logging import initialize_logging
+
+
+def initialize_application():
+    """Initialize the application requirements.
+
+    """
+    initialize_database()
+    initialize_logging()
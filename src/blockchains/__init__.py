@@ -1,3 +1,36 @@
 """Package for blockchain interactors.
 
 """
+import functools
+
+from src.blockchains.ethereum import EthereumService
+from src.blockchains.polygon import PolygonService
+from src.config import get_config
+
+
+@functools.lru_cache
+def get_ethereum_service() -> EthereumService:
+    """Get the shared Ethereum service. The service holds an HTTP
+    connection pool, so it is created only once per process.
+
+    Returns
+    -------
+    EthereumService
+        The Ethereum service.
+
+    """
+    return EthereumService(get_config()['URL']['ethereum'])
+
+
+@functools.lru_cache
+def get_polygon_service() -> PolygonService:
+    """Get the shared Polygon service. The service holds an HTTP
+    connection pool, so it is created only once per process.
+
+    Returns
+    -------
+    PolygonService
+        The Polygon service.
+
+    """
+    return PolygonService(get_config()['URL']['polygon'])
@@ -1,11 +1,29 @@
 """Module for interacting with Polygon.
 
 """
+import concurrent.futures
+import functools
+
 import web3.middleware
 import web3.types
 
 from src.blockchains.ethereum import TRANSFER_EVENT_ABI
 from src.blockchains.ethereum import EthereumService
+from src.blockchains.ethereum import to_checksum_address
+
+_DEFAULT_BLOCK_RANGE = 600
+"""The number of blocks queried per eth_getLogs request for a token
+without a known working block range."""
+
+_MAX_BLOCK_RANGE = 2400
+"""The largest number of blocks queried per eth_getLogs request."""
+
+_MIN_BLOCK_RANGE = 150
+"""The block range below which a failing eth_getLogs request is not
+split any further."""
+
+_TRANSFER_LOG_WORKERS = 8
+"""The number of transfer-log windows fetched concurrently."""
 
 
 class PolygonService(EthereumService):
@@ -19,6 +37,9 @@ class PolygonService(EthereumService):
         super().__init__(rpc_url)
         self._w3.middleware_onion.inject(web3.middleware.geth_poa_middleware,
                                          layer=0)
+        # The last known working block range per token address; dense
+        # tokens settle on small windows, sparse ones on large windows.
+        self.__block_ranges: dict[str, int] = {}
 
     def get_transfer_logs(self, from_block: int, to_block: int,
                           token_address: str) -> list[web3.types.EventData]:
@@ -37,20 +58,57 @@ class PolygonService(EthereumService):
             The list of logs.
 
         """
-        logs = []
-        max_block_range = 600
-        start_block = from_block
-        while start_block + max_block_range < to_block:
-            contract = self._w3.eth.contract(
-                address=web3.Web3.to_checksum_address(token_address),
-                abi=TRANSFER_EVENT_ABI)
-            logs += contract.events.Transfer().get_logs(  # type: ignore
-                fromBlock=start_block,
-                toBlock=start_block + max_block_range - 1)
-            start_block += max_block_range
+        # The contract is built once for all the windows instead of
+        # reparsing the ABI per window.
         contract = self._w3.eth.contract(
-            address=web3.Web3.to_checksum_address(token_address),
-            abi=TRANSFER_EVENT_ABI)
-        logs += contract.events.Transfer().get_logs(  # type: ignore
-            fromBlock=start_block, toBlock=to_block)
+            address=to_checksum_address(token_address), abi=TRANSFER_EVENT_ABI)
+        transfer_event = contract.events.Transfer()
+        block_range = self.__block_ranges.get(token_address.lower(),
+                                              _DEFAULT_BLOCK_RANGE)
+        windows = []
+        start_block = from_block
+        while start_block + block_range < to_block:
+            windows.append((start_block, start_block + block_range - 1))
+            start_block += block_range
+        windows.append((start_block, to_block))
+        # Each eth_getLogs call is latency bound and the windows are
+        # independent, so they are fetched concurrently.
+        logs: list[web3.types.EventData] = []
+        whole_windows_succeeded = True
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=_TRANSFER_LOG_WORKERS) as executor:
+            for window_logs, window_succeeded in executor.map(
+                    functools.partial(self.__fetch_window_logs,
+                                      transfer_event), windows):
+                logs += window_logs
+                whole_windows_succeeded &= window_succeeded
+        # The block range adapts per token: it is halved when a window
+        # had to be split and doubled after a fully clean pass.
+        if whole_windows_succeeded:
+            block_range = min(block_range * 2, _MAX_BLOCK_RANGE)
+        else:
+            block_range = max(block_range // 2, _MIN_BLOCK_RANGE)
+        self.__block_ranges[token_address.lower()] = block_range
+        logs.sort(key=lambda log: (log['blockNumber'], log['logIndex']))
         return logs
+
+    def __fetch_window_logs(
+            self, transfer_event,
+            window: tuple[int,
+                          int]) -> tuple[list[web3.types.EventData], bool]:
+        start_block, end_block = window
+        try:
+            return list(
+                transfer_event.get_logs(fromBlock=start_block,
+                                        toBlock=end_block)), True
+        except Exception:
+            # The node rejected or timed out on the window; bisect it
+            # until the halves are small enough to succeed.
+            if end_block - start_block + 1 <= _MIN_BLOCK_RANGE:
+                raise
+            middle_block = (start_block + end_block) // 2
+            first_logs, _ = self.__fetch_window_logs(
+                transfer_event, (start_block, middle_block))
+            second_logs, _ = self.__fetch_window_logs(
+                transfer_event, (middle_block + 1, end_block))
+            return first_logs + second_logs, False
@@ -1,11 +1,12 @@
 """Module for processing swap events.
 
 """
+import itertools
+import operator
 import typing
 
 import eth_typing
 import web3
-import web3.logs
 import web3.types
 
 from src.blockchains.ethereum import EthereumService
@@ -100,6 +101,14 @@ _UNISWAP_V3_EVENT = [{
     }]
 }]
 
+_UNISWAP_V2_SWAP_TOPIC = web3.Web3.keccak(
+    text='Swap(address,uint256,uint256,uint256,uint256,address)')
+"""The topic hash of the Uniswap v2 Swap event."""
+
+_UNISWAP_V3_SWAP_TOPIC = web3.Web3.keccak(
+    text='Swap(address,address,int256,int256,uint160,uint128,int24)')
+"""The topic hash of the Uniswap v3 Swap event."""
+
 
 class SwapProcessorError(BaseError):
     """Exception class for all swap processor errors.
@@ -120,11 +129,16 @@ class SwapProcessor:
 
     """
     def __init__(self, blockchain_service: EthereumService):
+        self.__blockchain_service = blockchain_service
         self.__w3 = blockchain_service.get_web3()
         self.__uniswap_v2_contract = self.__w3.eth.contract(
             abi=_UNISWAP_V2_EVENT)
         self.__uniswap_v3_contract = self.__w3.eth.contract(
             abi=_UNISWAP_V3_EVENT)
+        # A pool's token pair is immutable, so the eth_call results
+        # are kept for the lifetime of the processor.
+        self.__pool_tokens: dict[eth_typing.ChecksumAddress, tuple[str,
+                                                                   str]] = {}
 
     def process_transaction(
             self, transaction_hash: str) -> typing.Optional[list[Swap]]:
@@ -146,71 +160,86 @@ class SwapProcessor:
             If something went wrong.
 
         """
-        receipt = self.__w3.eth.get_transaction_receipt(
-            eth_typing.HexStr(transaction_hash))
-        v2_decoded_logs = self.__uniswap_v2_contract.events.Swap(
-        ).process_receipt(receipt, errors=web3.logs.DISCARD)
-        v3_decoded_logs = self.__uniswap_v3_contract.events.Swap(
-        ).process_receipt(receipt, errors=web3.logs.DISCARD)
+        receipt = self.__blockchain_service.get_transaction_receipt(
+            transaction_hash)
 
         all_swaps: list[Swap] = []
 
-        for v2_log in v2_decoded_logs:
-            all_swaps.append(self.__process_v2_swap(v2_log))
-        for v3_log in v3_decoded_logs:
-            all_swaps.append(self.__process_v3_swap(v3_log))
+        # The receipt logs are walked once and dispatched by their
+        # topic hash instead of running two full process_receipt
+        # passes that each try to decode every log.
+        for log in receipt['logs']:
+            topics = log['topics']
+            if len(topics) == 0:
+                continue
+            try:
+                if topics[0] == _UNISWAP_V2_SWAP_TOPIC:
+                    all_swaps.append(
+                        self.__process_v2_swap(self.__uniswap_v2_contract.
+                                               events.Swap().process_log(log)))
+                elif topics[0] == _UNISWAP_V3_SWAP_TOPIC:
+                    all_swaps.append(
+                        self.__process_v3_swap(self.__uniswap_v3_contract.
+                                               events.Swap().process_log(log)))
+            except Exception:
+                # Matching the process_receipt DISCARD behavior: logs
+                # with a matching topic but a different layout are
+                # skipped.
+                continue
 
         if len(all_swaps) == 0:
             return None
 
-        all_swaps.sort(key=lambda swap: swap.event_index)  # type: ignore
+        all_swaps.sort(key=operator.attrgetter('event_index'))
 
-        if len(all_swaps) > 1:
-            for i in range(len(all_swaps) - 1):
-                if all_swaps[i].token_out != all_swaps[i + 1].token_in:
-                    # this can mean that maybe 2 different unrelated swaps
-                    # are performed; we can handle this in the future if needed
-                    raise SwapProcessorError('multiple swaps detected',
-                                             transaction_hash=transaction_hash)
+        for swap, next_swap in itertools.pairwise(all_swaps):
+            if swap.token_out != next_swap.token_in:
+                # this can mean that maybe 2 different unrelated swaps
+                # are performed; we can handle this in the future if needed
+                raise SwapProcessorError('multiple swaps detected',
+                                         transaction_hash=transaction_hash)
 
         return all_swaps
 
     def __process_v2_swap(self, log: web3.types.EventData) -> Swap:
+        token0, token1 = self.__get_tokens(log['address'])
         if log['args']['amount0In'] == 0:
-            token_started_with = self.__get_token1(log['address'])
+            token_started_with = token1
             amount_started_with = log['args']['amount1In']
-            token_ended_up_with = self.__get_token0(log['address'])
+            token_ended_up_with = token0
             amount_ended_up_with = log['args']['amount0Out']
         else:
-            token_started_with = self.__get_token0(log['address'])
+            token_started_with = token0
             amount_started_with = log['args']['amount0In']
-            token_ended_up_with = self.__get_token1(log['address'])
+            token_ended_up_with = token1
             amount_ended_up_with = log['args']['amount1Out']
         return Swap(token_started_with, token_ended_up_with,
                     amount_started_with, amount_ended_up_with, log['logIndex'])
 
     def __process_v3_swap(self, log: web3.types.EventData) -> Swap:
+        token0, token1 = self.__get_tokens(log['address'])
         amount0 = log['args']['amount0']
         amount1 = log['args']['amount1']
         if amount0 < 0:
-            token_started_with = self.__get_token1(log['address'])
+            token_started_with = token1
             amount_started_with = amount1
-            token_ended_up_with = self.__get_token0(log['address'])
+            token_ended_up_with = token0
             amount_ended_up_with = -amount0
         else:
-            token_started_with = self.__get_token0(log['address'])
+            token_started_with = token0
             amount_started_with = amount0
-            token_ended_up_with = self.__get_token1(log['address'])
+            token_ended_up_with = token1
             amount_ended_up_with = -amount1
         return Swap(token_started_with, token_ended_up_with,
                     amount_started_with, amount_ended_up_with, log['logIndex'])
 
-    def __get_token0(self, address: eth_typing.ChecksumAddress) -> str:
-        pool_contract = self.__w3.eth.contract(address=address,
-                                               abi=_UNISWAP_POOL)
-        return pool_contract.functions.token0().call()
-
-    def __get_token1(self, address: eth_typing.ChecksumAddress) -> str:
-        pool_contract = self.__w3.eth.contract(address=address,
-                                               abi=_UNISWAP_POOL)
-        return pool_contract.functions.token1().call()
+    def __get_tokens(self,
+                     address: eth_typing.ChecksumAddress) -> tuple[str, str]:
+        tokens = self.__pool_tokens.get(address)
+        if tokens is None:
+            pool_contract = self.__w3.eth.contract(address=address,
+                                                   abi=_UNISWAP_POOL)
+            tokens = (pool_contract.functions.token0().call(),
+                      pool_contract.functions.token1().call())
+            self.__pool_tokens[address] = tokens
+        return tokens
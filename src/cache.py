@@ -0,0 +1,76 @@
+"""Module for caching API results on disk across runs.
+
+"""
+import os
+import sqlite3
+import threading
+import typing
+
+_CACHE_FILE = 'data/api_cache.db'
+"""The SQLite file holding the cached API results."""
+
+
+class PersistentCache:
+    """Persistent key-value cache backed by SQLite. The cached values
+    survive process restarts, so repeated backfill runs over the same
+    block ranges skip the corresponding API calls.
+
+    """
+    def __init__(self, namespace: str):
+        """Initialize and construct the instance.
+
+        Parameters
+        ----------
+        namespace : str
+            The name of the table holding the cached entries.
+
+        """
+        os.makedirs(os.path.dirname(_CACHE_FILE), exist_ok=True)
+        self.__namespace = namespace
+        self.__lock = threading.Lock()
+        # The write-ahead log allows concurrent readers and writers
+        # from the analysis worker processes sharing the cache file.
+        self.__connection = sqlite3.connect(_CACHE_FILE,
+                                            check_same_thread=False,
+                                            timeout=30)
+        with self.__lock, self.__connection:
+            self.__connection.execute('PRAGMA journal_mode=WAL;')
+            self.__connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {namespace} '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+
+    def get(self, key: str) -> typing.Optional[str]:
+        """Get the cached value for the given key.
+
+        Parameters
+        ----------
+        key : str
+            The key to look up.
+
+        Returns
+        -------
+        str or None
+            The cached value, or None if the key is not cached.
+
+        """
+        with self.__lock:
+            row = self.__connection.execute(
+                f'SELECT value FROM {self.__namespace} WHERE key = ?',
+                (key, )).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key: str, value: str) -> None:
+        """Cache the given value for the given key.
+
+        Parameters
+        ----------
+        key : str
+            The key to cache the value under.
+        value : str
+            The value to cache.
+
+        """
+        with self.__lock, self.__connection:
+            self.__connection.execute(
+                f'INSERT OR REPLACE INTO {self.__namespace} (key, value) '
+                'VALUES (?, ?)', (key, value))
@@ -4,12 +4,9 @@
 import argparse
 import logging
 
-from src.database import initialize_database
+from src.application import initialize_application
 from src.database.access import delete_block_data
-from src.database.access import get_all_block_numbers
-from src.database.access import get_all_block_numbers_with_traces_processed
-from src.database.access import get_all_meved_block_numbers
-from src.logging import initialize_logging
+from src.database.access import get_saved_block_number_ranges
 
 _logger = logging.getLogger(__name__)
 """Logger for this module."""
@@ -19,15 +16,13 @@ def view_data():
     """View which block data is saved.
 
     """
-    blocks_fetched = get_all_block_numbers()
-    blocks_meved = get_all_meved_block_numbers()
-    blocks_traces_processed = get_all_block_numbers_with_traces_processed()
     print('Blocks fetched:')
-    _print_all_blocks_intervals(blocks_fetched)
+    _print_all_blocks_intervals(get_saved_block_number_ranges())
     print('Blocks MEVed:')
-    _print_all_blocks_intervals(blocks_meved)
+    _print_all_blocks_intervals(get_saved_block_number_ranges(only_meved=True))
     print('Blocks with the traces processed:')
-    _print_all_blocks_intervals(blocks_traces_processed)
+    _print_all_blocks_intervals(
+        get_saved_block_number_ranges(only_traces_processed=True))
 
 
 def delete_data(block_number_start: int, block_number_end: int):
@@ -51,25 +46,16 @@ def delete_data(block_number_start: int, block_number_end: int):
     print(f'{number_of_deleted_blocks} blocks have been deleted.')
 
 
-def _print_all_blocks_intervals(block_numbers: list[int]):
-    blocks = sorted(block_numbers)
-    blocks_len = len(blocks)
-    if blocks_len == 0:
+def _print_all_blocks_intervals(block_ranges: list[tuple[int, int]]):
+    if len(block_ranges) == 0:
         print('No blocks are saved.')
         return
-    print(f'There are {blocks_len} blocks saved')
-    if len(blocks) == 1:
-        print(f'{blocks[0]}')
-        return
-    block_number_start = blocks[0]
-    block_number_end = blocks[0]
-    for block_number in blocks[1:]:
-        if block_number == block_number_end + 1:
-            block_number_end = block_number
-        else:
-            _print_blocks(block_number_start, block_number_end)
-            block_number_start = block_number_end = block_number
-    _print_blocks(block_number_start, block_number_end)
+    number_of_blocks = sum(
+        block_number_end - block_number_start + 1
+        for block_number_start, block_number_end in block_ranges)
+    print(f'There are {number_of_blocks} blocks saved')
+    for block_number_start, block_number_end in block_ranges:
+        _print_blocks(block_number_start, block_number_end)
 
 
 def _print_blocks(block_number_start: int, block_number_end: int):
@@ -101,8 +87,7 @@ def main():
 
 
 if __name__ == "__main__":
-    initialize_database()
-    initialize_logging()
+    initialize_application()
     try:
         main()
     except Exception:
@@ -50,13 +50,36 @@ def get_session() -> sqlalchemy.orm.Session:
     return get_session_maker()()
 
 
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # SQLite PRAGMAs are per connection, so they are applied on every
+    # new connection of the engine pool. WAL keeps the writers from
+    # serializing behind the readers of the worker threads.
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-65536')
+    cursor.close()
+
+
 def initialize_database() -> None:
     """Initialize the database.
 
     """
-    sql_engine = sqlalchemy.create_engine('sqlite:///data/blockchain_data.db')
-    with sql_engine.connect() as connection:
-        connection.execute(sqlalchemy.text('PRAGMA foreign_keys=ON;'))
+    # The pool is sized for the fetch worker threads, so each thread
+    # reuses a pooled connection instead of reopening the database
+    # file per session.
+    sql_engine = sqlalchemy.create_engine('sqlite:///data/blockchain_data.db',
+                                          insertmanyvalues_page_size=10000,
+                                          pool_size=10, max_overflow=20)
+    sqlalchemy.event.listen(sql_engine, 'connect', _set_sqlite_pragmas)
     Base.metadata.create_all(sql_engine)
+    # create_all skips tables that already exist, so all the declared
+    # indexes are created explicitly to also reach a database built
+    # before they were added to the schema.
+    for table in Base.metadata.tables.values():
+        for index in table.indexes:
+            index.create(sql_engine, checkfirst=True)
     global _session_maker
     _session_maker = sqlalchemy.orm.sessionmaker(bind=sql_engine)
@@ -1,7 +1,9 @@
 """Module for accessing database records.
 
 """
-import hexbytes
+import functools
+import typing
+
 import sqlalchemy.exc
 
 from src.api_utilities.zeromev import ZeroMev
@@ -15,6 +17,20 @@ from src.domain import MevType
 from src.domain import PolygonBridgeInteraction
 from src.domain import Transaction
 
+_MEV_TYPES_BY_VALUE = {mev_type.value: mev_type for mev_type in MevType}
+"""Lookup table for the MEV types; calling the enumeration constructor
+per row runs its lookup machinery, a dictionary access does not."""
+
+_BRIDGE_INTERACTIONS_BY_VALUE = {
+    bridge_interaction.value: bridge_interaction
+    for bridge_interaction in PolygonBridgeInteraction
+}
+"""Lookup table for the Polygon bridge interaction types."""
+
+_IN_CLAUSE_BATCH_SIZE = 10000
+"""Maximum number of values bound to a single IN clause; SQLite caps
+the number of bound parameters per statement at 32766."""
+
 
 def add_block(block: Block) -> None:
     """Add the given block to the database.
@@ -49,18 +65,64 @@ def add_transactions(block_number: int,
         already been added to the database.
 
     """
-    transaction_models = []
-    for i in range(0, len(transaction_hashes)):
-        transaction_models.append(
-            TransactionModel(transaction_hash=transaction_hashes[i],
-                             transaction_index=i, block_id=block_number))
+    # Plain dictionaries with a Core insert activate the executemany
+    # fast path (insertmanyvalues) and skip the per-row ORM object
+    # construction of the legacy bulk_save_objects.
+    transaction_values = [{
+        'transaction_hash': transaction_hash,
+        'transaction_index': i,
+        'block_id': block_number
+    } for i, transaction_hash in enumerate(transaction_hashes)]
+    if len(transaction_values) == 0:
+        return
     try:
         with get_session_maker().begin() as session:
-            session.bulk_save_objects(transaction_models)
+            session.execute(sqlalchemy.insert(TransactionModel),
+                            transaction_values)
     except sqlalchemy.exc.IntegrityError:
         raise DatabaseError('unkown block for the given transactions')
 
 
+def add_blocks_with_transactions(blocks: list[Block]) -> None:
+    """Add the given blocks and their transactions to the database
+    within a single database transaction.
+
+    Parameters
+    ----------
+    blocks : list of Block
+        The blocks to be added.
+
+    Raises
+    ------
+    DatabaseError
+        If one of the blocks or transactions already exists in the
+        database.
+
+    """
+    block_values = [{
+        'block_number': block['number'],
+        'miner': block['miner'],
+        'timestamp': block['timestamp']
+    } for block in blocks]
+    transaction_values = []
+    for block in blocks:
+        for i, transaction_hash in enumerate(block['transactions']):
+            transaction_values.append({
+                'transaction_hash': bytes(typing.cast(bytes,
+                                                      transaction_hash)),
+                'transaction_index': i,
+                'block_id': block['number']
+            })
+    try:
+        with get_session_maker().begin() as session:
+            session.execute(sqlalchemy.insert(BlockModel), block_values)
+            if len(transaction_values) > 0:
+                session.execute(sqlalchemy.insert(TransactionModel),
+                                transaction_values)
+    except sqlalchemy.exc.IntegrityError:
+        raise DatabaseError('one of the blocks has already been added')
+
+
 def get_transactions(block_number_start: int,
                      block_number_end: int) -> list[Transaction]:
     """Get the transactions of the given block numbers.
@@ -75,20 +137,91 @@ def get_transactions(block_number_start: int,
     Returns
     -------
     list of Transaction
-        The transactions to be fetched from the database.
+        The transactions to be fetched from the database, ordered by
+        block number and transaction index.
 
     """
-    statement = sqlalchemy.select(TransactionModel).where(
-        sqlalchemy.and_(TransactionModel.block_id >= block_number_start,
-                        TransactionModel.block_id <= block_number_end))
+    # Selecting plain columns avoids hydrating an ORM object per row;
+    # the rows are converted straight into the domain entities. The
+    # ordering allows the callers to group the transactions per block
+    # in a single pass without building an intermediate dictionary.
+    statement = sqlalchemy.select(
+        TransactionModel.block_id, TransactionModel.transaction_hash,
+        TransactionModel.transaction_index, TransactionModel.mev_type,
+        TransactionModel.polygon_bridge_interaction,
+        TransactionModel.coinbase_transfer_value).where(
+            sqlalchemy.and_(TransactionModel.block_id >= block_number_start,
+                            TransactionModel.block_id
+                            <= block_number_end)).order_by(
+                                TransactionModel.block_id,
+                                TransactionModel.transaction_index)
+    with get_session() as session:
+        # yield_per streams the rows in server-side partitions instead
+        # of buffering the whole range before the mapping starts.
+        return [
+            _transaction_row_to_entity(transaction_row)
+            for transaction_row in session.execute(
+                statement.execution_options(yield_per=1000))
+        ]
+
+
+def get_cross_chain_mev_candidate_transactions(
+        block_number_start: int, block_number_end: int) -> list[Transaction]:
+    """Get the cross-chain MEV candidate transactions of the given
+    block numbers. Those are the swap MEV transactions which interact
+    with the Polygon bridge and either pay a coinbase transfer or are
+    placed in the first tenth of their block.
+
+    Parameters
+    ----------
+    block_number_start : int
+        The number of the block to start the search from.
+    block_number_end : int
+        The number of the block to end the search at.
+
+    Returns
+    -------
+    list of Transaction
+        The candidate transactions, ordered by block number and
+        transaction index.
+
+    """
+    # The per-block transaction count is computed with a window
+    # function so that the candidate filter runs in the database and
+    # only the matching rows are hydrated into domain entities.
+    block_transactions = sqlalchemy.select(
+        TransactionModel.block_id, TransactionModel.transaction_hash,
+        TransactionModel.transaction_index, TransactionModel.mev_type,
+        TransactionModel.polygon_bridge_interaction,
+        TransactionModel.coinbase_transfer_value,
+        sqlalchemy.func.count().over(partition_by=TransactionModel.block_id).
+        label('transactions_in_block')).where(
+            sqlalchemy.and_(TransactionModel.block_id >= block_number_start,
+                            TransactionModel.block_id
+                            <= block_number_end)).subquery()
+    # The coinbase transfer value is stored as text with a default of
+    # '0', so the inequality against '0' is exact without a cast.
+    statement = sqlalchemy.select(
+        block_transactions.c.block_id, block_transactions.c.transaction_hash,
+        block_transactions.c.transaction_index, block_transactions.c.mev_type,
+        block_transactions.c.polygon_bridge_interaction,
+        block_transactions.c.coinbase_transfer_value).where(
+            sqlalchemy.and_(
+                block_transactions.c.mev_type == MevType.SWAP.value,
+                block_transactions.c.polygon_bridge_interaction
+                != PolygonBridgeInteraction.NONE.value,
+                sqlalchemy.or_(
+                    block_transactions.c.coinbase_transfer_value != '0',
+                    block_transactions.c.transaction_index * 10
+                    < block_transactions.c.transactions_in_block))).order_by(
+                        block_transactions.c.block_id,
+                        block_transactions.c.transaction_index)
     with get_session() as session:
-        transaction_models = session.execute(statement).scalars().all()
-        session.expunge_all()
-        transactions = [
-            _transaction_model_to_entity(transaction_model)
-            for transaction_model in transaction_models
+        return [
+            _transaction_row_to_entity(transaction_row)
+            for transaction_row in session.execute(
+                statement.execution_options(yield_per=1000))
         ]
-        return transactions
 
 
 def get_all_block_numbers() -> list[int]:
@@ -102,9 +235,11 @@ def get_all_block_numbers() -> list[int]:
     """
     statement = sqlalchemy.select(BlockModel.block_number)
     with get_session() as session:
-        block_numbers = session.execute(statement).scalars().all()
-        session.expunge_all()
-        return list(block_numbers)
+        # The column select never hydrates ORM objects; streaming the
+        # scalars straight into the list avoids a second full copy.
+        return list(
+            session.execute(
+                statement.execution_options(yield_per=5000)).scalars())
 
 
 def get_all_meved_block_numbers() -> list[int]:
@@ -119,9 +254,11 @@ def get_all_meved_block_numbers() -> list[int]:
     statement = sqlalchemy.select(BlockModel.block_number).where(
         BlockModel.mev_added == sqlalchemy.true())
     with get_session() as session:
-        block_numbers = session.execute(statement).scalars().all()
-        session.expunge_all()
-        return list(block_numbers)
+        # The column select never hydrates ORM objects; streaming the
+        # scalars straight into the list avoids a second full copy.
+        return list(
+            session.execute(
+                statement.execution_options(yield_per=5000)).scalars())
 
 
 def get_all_block_numbers_with_traces_processed() -> list[int]:
@@ -136,9 +273,66 @@ def get_all_block_numbers_with_traces_processed() -> list[int]:
     statement = sqlalchemy.select(BlockModel.block_number).where(
         BlockModel.traces_processed == sqlalchemy.true())
     with get_session() as session:
-        block_numbers = session.execute(statement).scalars().all()
-        session.expunge_all()
-        return list(block_numbers)
+        # The column select never hydrates ORM objects; streaming the
+        # scalars straight into the list avoids a second full copy.
+        return list(
+            session.execute(
+                statement.execution_options(yield_per=5000)).scalars())
+
+
+def get_saved_block_number_ranges(
+        only_meved: bool = False, only_traces_processed: bool = False,
+        block_number_start: typing.Optional[int] = None,
+        block_number_end: typing.Optional[int] = None
+) -> list[tuple[int, int]]:
+    """Get the ranges of consecutive saved block numbers. The ranges
+    are computed in the database with the islands-and-gaps query
+    instead of materializing every block number in Python.
+
+    Parameters
+    ----------
+    only_meved : bool
+        If True, only the MEVed blocks are considered.
+    only_traces_processed : bool
+        If True, only the blocks with the traces processed are
+        considered.
+    block_number_start : int, optional
+        If given, blocks below this number are not considered.
+    block_number_end : int, optional
+        If given, blocks above this number are not considered.
+
+    Returns
+    -------
+    list of tuple of int and int
+        The inclusive block number ranges, ordered by block number.
+
+    """
+    row_number = sqlalchemy.func.row_number().over(
+        order_by=BlockModel.block_number)
+    inner_statement = sqlalchemy.select(
+        BlockModel.block_number.label('block_number'),
+        (BlockModel.block_number - row_number).label('range_key'))
+    if only_meved:
+        inner_statement = inner_statement.where(
+            BlockModel.mev_added == sqlalchemy.true())
+    if only_traces_processed:
+        inner_statement = inner_statement.where(
+            BlockModel.traces_processed == sqlalchemy.true())
+    if block_number_start is not None:
+        inner_statement = inner_statement.where(
+            BlockModel.block_number >= block_number_start)
+    if block_number_end is not None:
+        inner_statement = inner_statement.where(
+            BlockModel.block_number <= block_number_end)
+    subquery = inner_statement.subquery()
+    statement = sqlalchemy.select(
+        sqlalchemy.func.min(subquery.c.block_number),
+        sqlalchemy.func.max(subquery.c.block_number)).group_by(
+            subquery.c.range_key).order_by(
+                sqlalchemy.func.min(subquery.c.block_number))
+    with get_session() as session:
+        return [(range_start, range_end)
+                for range_start, range_end in session.execute(statement)]
 
 
 def get_saved_block_numbers(block_number_start: int,
@@ -163,9 +357,11 @@ def get_saved_block_numbers(block_number_start: int,
         sqlalchemy.and_(BlockModel.block_number >= block_number_start,
                         BlockModel.block_number <= block_number_end))
     with get_session() as session:
-        block_numbers = session.execute(statement).scalars().all()
-        session.expunge_all()
-        return list(block_numbers)
+        # The column select never hydrates ORM objects; streaming the
+        # scalars straight into the list avoids a second full copy.
+        return list(
+            session.execute(
+                statement.execution_options(yield_per=5000)).scalars())
 
 
 def get_non_meved_blocks(block_number_start: int,
@@ -191,9 +387,11 @@ def get_non_meved_blocks(block_number_start: int,
                         BlockModel.block_number <= block_number_end,
                         BlockModel.mev_added == sqlalchemy.false()))
     with get_session() as session:
-        block_numbers = session.execute(statement).scalars().all()
-        session.expunge_all()
-        return list(block_numbers)
+        # The column select never hydrates ORM objects; streaming the
+        # scalars straight into the list avoids a second full copy.
+        return list(
+            session.execute(
+                statement.execution_options(yield_per=5000)).scalars())
 
 
 def get_blocks_without_traces_processed(block_number_start: int,
@@ -218,11 +416,16 @@ def get_blocks_without_traces_processed(block_number_start: int,
                         BlockModel.block_number <= block_number_end,
                         BlockModel.traces_processed == sqlalchemy.false()))
     with get_session() as session:
-        block_numbers = session.execute(statement).scalars().all()
-        session.expunge_all()
-        return list(block_numbers)
+        # The column select never hydrates ORM objects; streaming the
+        # scalars straight into the list avoids a second full copy.
+        return list(
+            session.execute(
+                statement.execution_options(yield_per=5000)).scalars())
 
 
+# Block metadata is immutable once written, so the point lookups are
+# cached; the caches are cleared when blocks are deleted.
+@functools.lru_cache(maxsize=16384)
 def get_block_builder_address(block_number: int) -> str:
     """Get the block builder address given the block number.
 
@@ -240,10 +443,37 @@ def get_block_builder_address(block_number: int) -> str:
     statement = sqlalchemy.select(
         BlockModel.miner).where(BlockModel.block_number == block_number)
     with get_session() as session:
-        builder = session.execute(statement).scalars().one()
-        return builder
+        return session.execute(statement).scalar_one()
+
 
+def get_block_builder_addresses(block_numbers: list[int]) -> dict[int, str]:
+    """Get the block builder addresses of the given block numbers,
+    queried in batches small enough for SQLite's bound-parameter limit.
+
+    Parameters
+    ----------
+    block_numbers : list of int
+        The numbers of the blocks.
+
+    Returns
+    -------
+    dict of int, str
+        The block numbers to their builder addresses.
 
+    """
+    builder_addresses: dict[int, str] = {}
+    with get_session() as session:
+        for i in range(0, len(block_numbers), _IN_CLAUSE_BATCH_SIZE):
+            statement = sqlalchemy.select(
+                BlockModel.block_number, BlockModel.miner).where(
+                    BlockModel.block_number.in_(
+                        block_numbers[i:i + _IN_CLAUSE_BATCH_SIZE]))
+            builder_addresses.update((row.block_number, row.miner)
+                                     for row in session.execute(statement))
+    return builder_addresses
+
+
+@functools.lru_cache(maxsize=16384)
 def get_block_timestamp(block_number: int) -> int:
     """Get the timestamp of the given block number.
 
@@ -261,7 +491,34 @@ def get_block_timestamp(block_number: int) -> int:
     statement = sqlalchemy.select(
         BlockModel.timestamp).where(BlockModel.block_number == block_number)
     with get_session() as session:
-        return session.execute(statement).scalars().one()
+        return session.execute(statement).scalar_one()
+
+
+def get_block_timestamps(block_numbers: list[int]) -> dict[int, int]:
+    """Get the timestamps of the given block numbers, queried in
+    batches small enough for SQLite's bound-parameter limit.
+
+    Parameters
+    ----------
+    block_numbers : list of int
+        The numbers of the blocks.
+
+    Returns
+    -------
+    dict of int, int
+        The block numbers to their timestamps.
+
+    """
+    timestamps: dict[int, int] = {}
+    with get_session() as session:
+        for i in range(0, len(block_numbers), _IN_CLAUSE_BATCH_SIZE):
+            statement = sqlalchemy.select(
+                BlockModel.block_number, BlockModel.timestamp).where(
+                    BlockModel.block_number.in_(
+                        block_numbers[i:i + _IN_CLAUSE_BATCH_SIZE]))
+            timestamps.update((row.block_number, row.timestamp)
+                              for row in session.execute(statement))
+    return timestamps
 
 
 def update_blocks_with_mev(block_number_start: int,
@@ -301,60 +558,88 @@ def update_block_with_trace_processed(block_number: int) -> None:
         session.execute(statement)
 
 
-def update_transaction_with_bridge_information(
-        transaction_hash: str,
-        polygon_bridge_interaction: PolygonBridgeInteraction) -> None:
-    """Update a transaction record with Polygon bridge information.
+def update_transactions_with_bridge_information(
+        updates: list[tuple[bytes, PolygonBridgeInteraction]]) -> None:
+    """Update transaction records with Polygon bridge information
+    with a single batched statement.
 
     Parameters
     ----------
-    transaction_hash : str
-        The hash of the transaction to update.
+    updates : list of tuple of bytes and PolygonBridgeInteraction
+        The transaction hashes with their bridge interactions.
 
     """
     statement = sqlalchemy.update(TransactionModel).where(
-        TransactionModel.transaction_hash == transaction_hash).values(
-            polygon_bridge_interaction=polygon_bridge_interaction.value)
+        TransactionModel.transaction_hash == sqlalchemy.bindparam(
+            'b_transaction_hash')).values(
+                polygon_bridge_interaction=sqlalchemy.bindparam(
+                    'b_polygon_bridge_interaction'))
+    # The statement runs on the Core connection so that it executes as
+    # a single executemany instead of a per-row ORM bulk update.
     with get_session_maker().begin() as session:
-        session.execute(statement)
+        session.connection().execute(statement, [{
+            'b_transaction_hash': transaction_hash,
+            'b_polygon_bridge_interaction': polygon_bridge_interaction.value
+        } for transaction_hash, polygon_bridge_interaction in updates])
 
 
-def update_transaction_coinbase_transfer_value(
-        transaction_hash: str, coinbase_transfer_value: str) -> None:
-    """Update the transaction with the coinbase transfer value.
+def update_transactions_coinbase_transfer_value(
+        updates: list[tuple[bytes, str]]) -> None:
+    """Update transaction records with their coinbase transfer values
+    with a single batched statement.
 
     Parameters
     ----------
-    transaction_hash : str
-        The hash of the transaction to update.
-    coinbase_transfer_value : str
-        The amount of Wei transfered to the builder in the transaction.
+    updates : list of tuple of bytes and str
+        The transaction hashes with the amounts of Wei transfered to
+        the builder in the transactions.
 
     """
     statement = sqlalchemy.update(TransactionModel).where(
-        TransactionModel.transaction_hash == transaction_hash).values(
-            coinbase_transfer_value=coinbase_transfer_value)
+        TransactionModel.transaction_hash == sqlalchemy.bindparam(
+            'b_transaction_hash')).values(
+                coinbase_transfer_value=sqlalchemy.bindparam(
+                    'b_coinbase_transfer_value'))
     with get_session_maker().begin() as session:
-        session.execute(statement)
+        session.connection().execute(statement, [{
+            'b_transaction_hash': transaction_hash,
+            'b_coinbase_transfer_value': coinbase_transfer_value
+        } for transaction_hash, coinbase_transfer_value in updates])
 
 
-def update_transaction_with_mev(
-        zero_mev_tranaction: ZeroMev.TransactionResponse) -> None:
-    """Update a transaction record with MEV details.
+def update_transactions_with_mev(
+        zero_mev_transactions: list[ZeroMev.TransactionResponse]) -> None:
+    """Update transaction records with MEV details with a single
+    batched statement.
 
     Parameters
     ----------
-    ZeroMev.TransactionResponse
-        MEV transaction details.
+    zero_mev_transactions : list of ZeroMev.TransactionResponse
+        The MEV transaction details.
 
     """
+    # Duplicate entries for the same transaction are collapsed before
+    # the update, keeping the last reported MEV type.
+    deduplicated_mev_types = {}
+    for zero_mev_transaction in zero_mev_transactions:
+        deduplicated_mev_types[zero_mev_transaction.block_number,
+                               zero_mev_transaction.transactiion_index] = \
+            zero_mev_transaction.mev_type
     statement = sqlalchemy.update(TransactionModel).where(
         sqlalchemy.and_(
-            TransactionModel.block_id == zero_mev_tranaction.block_number,
-            TransactionModel.transaction_index == zero_mev_tranaction.
-            transactiion_index)).values(mev_type=zero_mev_tranaction.mev_type)
+            TransactionModel.block_id == sqlalchemy.bindparam('b_block_id'),
+            TransactionModel.transaction_index == sqlalchemy.bindparam(
+                'b_transaction_index'))).values(
+                    mev_type=sqlalchemy.bindparam('b_mev_type'))
+    # The statement runs on the Core connection so that it executes as
+    # a single executemany instead of a per-row ORM bulk update.
     with get_session_maker().begin() as session:
-        session.execute(statement)
+        session.connection().execute(statement, [{
+            'b_block_id': block_id,
+            'b_transaction_index': transaction_index,
+            'b_mev_type': mev_type.value
+        } for (block_id,
+               transaction_index), mev_type in deduplicated_mev_types.items()])
 
 
 def delete_block_data(block_number_start: int, block_number_end: int) -> int:
@@ -381,17 +666,18 @@ def delete_block_data(block_number_start: int, block_number_end: int) -> int:
         session.execute(delete_transactions_statement)
         number_of_deleted_blocks = session.execute(
             delete_blocks_statement).rowcount
-        return number_of_deleted_blocks
+    get_block_builder_address.cache_clear()
+    get_block_timestamp.cache_clear()
+    return number_of_deleted_blocks
 
 
-def _transaction_model_to_entity(
-        transaction_model: TransactionModel) -> Transaction:
-    """Maps a transaction database model to a entity.
+def _transaction_row_to_entity(transaction_row: sqlalchemy.Row) -> Transaction:
+    """Maps a transaction database row to a entity.
 
     Parameters
     ----------
-    transaction_model : TransactionModel
-        The transaction database model.
+    transaction_row : sqlalchemy.Row
+        The transaction database row.
 
     Returns
     -------
@@ -399,12 +685,13 @@ def _transaction_model_to_entity(
         The transaction entity.
 
     """
+    # The hash is formatted with bytes.hex directly instead of going
+    # through a throwaway HexBytes instance per row.
     return Transaction(
-        block_number=transaction_model.block_id,
-        transaction_hash=hexbytes.HexBytes(
-            transaction_model.transaction_hash).hex(),
-        transaction_index=transaction_model.transaction_index,
-        mev_type=MevType(transaction_model.mev_type),
-        polygon_bridge_interaction=PolygonBridgeInteraction(
-            transaction_model.polygon_bridge_interaction),
-        coinbase_transfer_value=int(transaction_model.coinbase_transfer_value))
+        block_number=transaction_row.block_id,
+        transaction_hash=f'0x{transaction_row.transaction_hash.hex()}',
+        transaction_index=transaction_row.transaction_index,
+        mev_type=_MEV_TYPES_BY_VALUE[transaction_row.mev_type],
+        polygon_bridge_interaction=_BRIDGE_INTERACTIONS_BY_VALUE[
+            transaction_row.polygon_bridge_interaction],
+        coinbase_transfer_value=int(transaction_row.coinbase_transfer_value))
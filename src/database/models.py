@@ -20,6 +20,14 @@ class BlockModel(Base):
 
     """
     __tablename__ = "blocks"
+    # Cover the pending-work scans; the partial indexes stay small
+    # because finished blocks drop out of them.
+    __table_args__ = (
+        sqlalchemy.schema.Index('ix_blocks_mev_not_added', 'block_number',
+                                sqlite_where=sqlalchemy.text('mev_added = 0')),
+        sqlalchemy.schema.Index(
+            'ix_blocks_traces_not_processed', 'block_number',
+            sqlite_where=sqlalchemy.text('traces_processed = 0')))
 
     block_number: sqlalchemy.orm.Mapped[int] = sqlalchemy.orm.mapped_column(
         primary_key=True)
@@ -40,6 +48,10 @@ class TransactionModel(Base):
 
     """
     __tablename__ = "transactions"
+    # Covers the candidate filter of the cross-chain MEV analysis.
+    __table_args__ = (sqlalchemy.schema.Index(
+        'ix_transactions_block_id_mev_type_bridge_interaction', 'block_id',
+        'mev_type', 'polygon_bridge_interaction'), )
 
     transaction_hash: sqlalchemy.orm.Mapped[
         bytes] = sqlalchemy.orm.mapped_column(primary_key=True)
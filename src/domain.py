@@ -37,11 +37,12 @@ class MevType(enum.IntEnum):
             If no enumeration member can be found for the given name.
 
         """
-        name_upper = name.upper()
-        for mev_type in MevType:
-            if name_upper == mev_type.name:
-                return mev_type
-        raise NameError(name)
+        # __members__ is a name-to-member mapping, so the lookup is a
+        # single dictionary access instead of a scan of the members.
+        try:
+            return MevType.__members__[name.upper()]
+        except KeyError:
+            raise NameError(name)
 
 
 class PolygonBridgeInteraction(enum.IntEnum):
@@ -53,7 +54,7 @@ class PolygonBridgeInteraction(enum.IntEnum):
     TO_ETHEREUM = 2
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Transaction:
     """The transaction model.
 
@@ -74,7 +75,7 @@ BlockTrace = typing.NamedTuple(
                    ('transaction_traces', list[TransactionTrace])])
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Swap:
     """Information about the swap.
 
@@ -86,7 +87,7 @@ class Swap:
     event_index: typing.Optional[int] = None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class EthereumLeg:
     """The Ethereum leg information of the cross-chain MEV extraction.
 
@@ -99,7 +100,7 @@ class EthereumLeg:
     gas_paid: typing.Optional[int] = None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class PolygonLeg:
     """The Polygon leg information of the cross-chain MEV extraction.
 
@@ -114,7 +115,7 @@ class PolygonLeg:
     swap_transaction_gas_paid: typing.Optional[int] = None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class CrossChainMevExtraction:
     """Cross-chain MEV extraction information.
 
@@ -128,7 +129,7 @@ class CrossChainMevExtraction:
     profit_token_symbol: typing.Optional[str] = None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class CrossChainMevFailedExtraction:
     """Failed cross-chain MEV extraction information.
 
@@ -0,0 +1,64 @@
+"""Module for retrying failing requests.
+
+"""
+import functools
+import logging
+import random
+import time
+import typing
+
+from src.exceptions import BaseError
+
+_logger = logging.getLogger(__name__)
+"""Logger for this module."""
+
+MAX_REQUEST_ATTEMPTS = 8
+"""The maximum number of attempts for a failing request."""
+
+_BASE_DELAY_SECONDS = 0.5
+"""The backoff delay of the first retry."""
+
+_MAX_DELAY_SECONDS = 10.0
+"""The largest backoff delay between two attempts."""
+
+_CallableT = typing.TypeVar('_CallableT', bound=typing.Callable)
+
+
+def retry_request(function: _CallableT) -> _CallableT:
+    """Decorator that retries the wrapped function with exponential
+    backoff and jitter. Application errors derived from BaseError are
+    raised right away; after the attempts for other errors are
+    exhausted, the last error is raised instead of retrying forever.
+
+    Parameters
+    ----------
+    function : callable
+        The function to retry.
+
+    Returns
+    -------
+    callable
+        The wrapped function.
+
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        for attempt in range(MAX_REQUEST_ATTEMPTS):
+            try:
+                return function(*args, **kwargs)
+            except BaseError:
+                raise
+            except Exception as error:
+                if attempt + 1 == MAX_REQUEST_ATTEMPTS:
+                    raise
+                # The jitter keeps the concurrent workers from
+                # retrying in lockstep against a struggling endpoint.
+                delay = (
+                    min(_MAX_DELAY_SECONDS, _BASE_DELAY_SECONDS * 2**attempt) +
+                    random.uniform(0, _BASE_DELAY_SECONDS))
+                _logger.error(f'{function.__qualname__} failed on attempt '
+                              f'{attempt + 1}; retrying in {delay:.1f}s')
+                _logger.error(f'error reason: {error}')
+                time.sleep(delay)
+
+    return typing.cast(_CallableT, wrapper)